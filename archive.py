@@ -0,0 +1,114 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import asyncio
+import gzip
+import json
+import logging
+import os
+import uuid
+import zlib
+
+
+def warc_record(warc_type, headers, block):
+    """ A WARC/1.1 record of the given type, block is the bytes of its content """
+    lines = [
+        "WARC/1.1",
+        f"WARC-Type: {warc_type}",
+        f"WARC-Record-ID: <urn:uuid:{uuid.uuid4()}>",
+        f"WARC-Date: {datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')}",
+        *(f"{name}: {value}" for name, value in headers.items()),
+        f"Content-Length: {len(block)}",
+    ]
+    return "\r\n".join(lines).encode("utf-8") + b"\r\n\r\n" + block + b"\r\n\r\n"
+
+
+def response_block(response_text):
+    """ The HTTP response of a page as recorded: the decoded body, stored as UTF-8 """
+    body = response_text.encode("utf-8")
+    head = f"HTTP/1.1 200 OK\r\nContent-Type: text/html; charset=utf-8\r\nContent-Length: {len(body)}\r\n\r\n"
+    return head.encode("latin-1") + body
+
+
+class WarcWriter:
+    """ Records the fetched pages as WARC response records into <output>.warc.gz, for an offline replay of the crawl
+
+    Every record is a gzip member of its own, so the file stays readable by the usual WARC tools and a record can be
+    read on its own. Its URL, offset and length are appended to the index <output>.warc.gz.idx (JSON lines).
+    Compressing and writing run in a background thread, in the order of the pages, at most max_pending pages wait for it.
+    """
+
+    def __init__(self, path, append, log_queue, max_pending):
+        self.path = path
+        self.log_queue = log_queue
+        # The messages of the thread are handed back to the event loop, which the log pipeline runs on
+        self.loop = asyncio.get_running_loop()
+        self.pending = asyncio.Semaphore(max_pending)
+        self.records = 0
+        new_file = not append or not os.path.exists(path)
+        self.file = open(path, "wb" if new_file else "ab")
+        self.index = open(f"{path}.idx", "w" if new_file else "a", encoding="utf-8")
+        # A single thread keeps the records in order and the compression off the event loop
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        if new_file:
+            info = b"software: Webshop Scraper\r\nformat: WARC File Format 1.1\r\n"
+            self.file.write(gzip.compress(warc_record("warcinfo", {"Content-Type": "application/warc-fields"}, info), mtime=0))
+
+    async def write(self, url, response_text):
+        """ Hand over a fetched page, only waits while max_pending pages are still waiting to be recorded """
+        await self.pending.acquire()
+        future = self.executor.submit(self.write_record, url, response_text)
+        future.add_done_callback(lambda _: self.loop.call_soon_threadsafe(self.pending.release))
+
+    def write_record(self, url, response_text):
+        try:
+            record = warc_record("response", {"WARC-Target-URI": url, "Content-Type": "application/http;msgtype=response"}, response_block(response_text))
+            compressed = gzip.compress(record, mtime=0)
+            offset = self.file.tell()
+            self.file.write(compressed)
+            # The record is on disk before its index entry, so an interrupted crawl never indexes a partial record
+            self.file.flush()
+            self.index.write(json.dumps({"url": url, "offset": offset, "length": len(compressed)}) + "\n")
+            self.index.flush()
+            self.records += 1
+        except Exception as e:
+            logging.error(f"Error while recording {url}: {e}")
+            self.loop.call_soon_threadsafe(self.log_queue.put, f"Error while recording {url}: {e}")
+
+    def close(self):
+        self.executor.shutdown()
+        self.file.close()
+        self.index.close()
+
+    def summary(self):
+        return f"Archive: {self.records} pages recorded in {self.path} ({os.path.getsize(self.path) / (1024 * 1024):.1f} MB)."
+
+
+def read_index(path):
+    """ The (url, offset, length) of every recorded page in the order of the crawl, a page recorded twice (resumed crawl) by its last record """
+    entries = {}
+    with open(f"{path}.idx", encoding="utf-8") as index:
+        for line in index:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # the last line of an interrupted crawl
+                continue
+            entries[entry["url"]] = (entry["offset"], entry["length"])
+    return [(url, offset, length) for url, (offset, length) in entries.items()]
+
+
+def read_record(file, offset, length):
+    """ The page of the record at the offset of an open archive, raises ValueError for a broken record """
+    file.seek(offset)
+    try:
+        record = zlib.decompress(file.read(length), wbits=31)
+    except zlib.error as e:
+        raise ValueError(f"broken gzip member at {offset}: {e}")
+
+    head, _, rest = record.partition(b"\r\n\r\n")
+    headers = dict(line.split(": ", 1) for line in head.decode("utf-8").split("\r\n")[1:] if ": " in line)
+    block = rest[:int(headers.get("Content-Length", len(rest)))]
+    _, separator, body = block.partition(b"\r\n\r\n")
+    if not separator:
+        raise ValueError(f"no HTTP response in the record at {offset}")
+    return body.decode("utf-8", errors="replace")
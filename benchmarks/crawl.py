@@ -0,0 +1,221 @@
+""" End-to-end crawl benchmark against the local mock webshop, reported as JSON
+
+Run from the repository root:
+    python -m benchmarks.crawl --pages 2000 --fan-out 20 --latency 0.02 --error-rate 0.01 --output report.json
+
+The mock shop runs in its own process, the scraper crawls it with the
+settings of constants.py (the --concurrency and --mode can be overridden).
+The report contains pages/sec, products/sec, p50/p95 fetch latency (including
+the wait for the rate limiter and retries), the parse
+time per page (parse_page inline on a sample of pages), the CPU time of the
+scraper and its parse workers and their peak memory. With --replay the crawl
+is recorded and the report adds the offline replay of its archive.
+"""
+from multiprocessing import Process
+import argparse
+import asyncio
+import json
+import queue
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import timeit
+import aiohttp
+import psutil
+from benchmarks import mock_shop
+from constants import PARSER_BACKEND
+from scraper import Scraper, parse_page
+
+PARSE_SAMPLE = 50
+
+
+class ResourceSampler:
+    """ Samples the CPU time and the memory of this process and its children (the parse workers) every 0.1 s """
+
+    def __init__(self, exclude_pids):
+        self.process = psutil.Process()
+        self.exclude_pids = set(exclude_pids)
+        self.cpu_times = {}
+        self.peak_rss = 0
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def run(self):
+        while self.running:
+            self.sample()
+            time.sleep(0.1)
+
+    def sample(self):
+        rss = 0
+        processes = [self.process] + [child for child in self.process.children(recursive=True) if child.pid not in self.exclude_pids]
+        for process in processes:
+            try:
+                cpu_times = process.cpu_times()
+                self.cpu_times[process.pid] = cpu_times.user + cpu_times.system
+                rss += process.memory_info().rss
+            except psutil.Error:
+                continue
+        self.peak_rss = max(self.peak_rss, rss)
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+        self.sample()
+
+
+class BenchmarkScraper(Scraper):
+    """ Scraper that records the latency of every fetch """
+
+    def __init__(self):
+        super().__init__()
+        self.fetch_latencies = []
+
+    async def fetch(self, session, url, headers, log_queue, retries=None):
+        started = time.monotonic()
+        try:
+            if retries is None:
+                return await super().fetch(session, url, headers, log_queue)
+            return await super().fetch(session, url, headers, log_queue, retries)
+        finally:
+            self.fetch_latencies.append(time.monotonic() - started)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_for_shop(url, timeout=10):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while True:
+            try:
+                async with session.get(url) as response:
+                    await response.read()
+                    return
+            except aiohttp.ClientError:
+                if time.monotonic() > deadline:
+                    raise
+                await asyncio.sleep(0.1)
+
+
+def percentile(values, share):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+
+def parse_time_per_page(config, mode, parser_backend):
+    """ Mean time of parse_page on a sample of product and category pages, inline and without network """
+    pages = [(f"http://127.0.0.1{mock_shop.page_url(n)}", mock_shop.render_page(config, n)) for n in range(min(PARSE_SAMPLE, config.pages))]
+    prod_els = {field: "" for field in ("name", "sku", "price", "desc", "image")}
+    seconds = min(timeit.repeat(lambda: [parse_page(url, html, "/products/", mode, prod_els, [], parser_backend=parser_backend or PARSER_BACKEND) for url, html in pages], number=1, repeat=3))
+    return seconds / len(pages)
+
+
+async def run_crawl(scraper, settings):
+    scraper.settings = settings
+    scraper.adv_settings = {"blacklist": ""}
+    await scraper.start_scraping()
+
+
+def run(args):
+    config = mock_shop.config_from_args(args)
+    port = free_port()
+    shop = Process(target=mock_shop.serve, args=(config, port), daemon=True)
+    shop.start()
+    start_url = f"http://127.0.0.1:{port}/"
+    asyncio.run(wait_for_shop(start_url))
+
+    scraper = BenchmarkScraper()
+    sampler = ResourceSampler(exclude_pids=[shop.pid])
+    with tempfile.TemporaryDirectory() as output_dir:
+        settings = {
+            "url": start_url,
+            "mode": args.mode,
+            "product_identifier": "/products/",
+            "prod_els": {field: "" for field in ("name", "sku", "price", "desc", "image")},
+            "output_dir": output_dir,
+            "output_name": "benchmark",
+            "concurrency": args.concurrency,
+            "parser_backend": args.parser,
+            "listing": args.listing,
+            "archive": args.replay,
+            "log_queue": queue.Queue(),
+        }
+        sampler.start()
+        started = time.monotonic()
+        try:
+            asyncio.run(run_crawl(scraper, settings))
+        finally:
+            seconds = time.monotonic() - started
+            sampler.stop()
+            shop.terminate()
+            shop.join()
+
+        # Re-extract the recorded pages offline, the shop is gone by now
+        replay = None
+        if args.replay:
+            replay_scraper = Scraper()
+            replay_started = time.monotonic()
+            asyncio.run(run_crawl(replay_scraper, {**settings, "replay": True}))
+            replay_seconds = time.monotonic() - replay_started
+            replay = {
+                "pages": replay_scraper.visited_count,
+                "products": replay_scraper.product_qty,
+                "seconds": round(replay_seconds, 3),
+                "pages_per_sec": round(replay_scraper.visited_count / replay_seconds, 1),
+            }
+
+    cpu_seconds = sum(sampler.cpu_times.values())
+    latencies = scraper.fetch_latencies
+    return {
+        "config": {**config.as_dict(), "mode": args.mode, "concurrency": args.concurrency, "parser": args.parser, "listing": args.listing, "replay": args.replay},
+        "finished": scraper.job_finished,
+        "pages": scraper.visited_count,
+        "products": scraper.product_qty,
+        "seconds": round(seconds, 3),
+        "pages_per_sec": round(scraper.visited_count / seconds, 1),
+        "products_per_sec": round(scraper.product_qty / seconds, 1),
+        "fetch_latency_ms": {
+            "p50": round(percentile(latencies, 0.5) * 1000, 2) if latencies else None,
+            "p95": round(percentile(latencies, 0.95) * 1000, 2) if latencies else None,
+            "mean": round(statistics.fmean(latencies) * 1000, 2) if latencies else None,
+        },
+        "parse_ms_per_page": round(parse_time_per_page(config, args.mode, args.parser) * 1000, 3),
+        "cpu_seconds": round(cpu_seconds, 2),
+        "cpu_percent": round(100 * cpu_seconds / seconds, 1),
+        "peak_memory_mb": round(sampler.peak_rss / (1024 * 1024), 1),
+        "replay": replay,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Crawl a local mock webshop and report the performance as JSON.")
+    mock_shop.add_arguments(parser)
+    parser.add_argument("--mode", choices=["json", "html"], default="json", help="mode of the scraper")
+    parser.add_argument("--concurrency", type=int, default=None, help="simultaneous scraping tasks (default: SIMULTANEOUS_SCRAPS)")
+    parser.add_argument("--parser", choices=["lxml", "selectolax", "soup"], default=None, help="HTML parser of the parse stage (default: PARSER_BACKEND)")
+    parser.add_argument("--listing", action="store_true", help="extract the products of the category pages (see --listing-markup)")
+    parser.add_argument("--replay", action="store_true", help="record the crawl and report the offline replay of its archive as well")
+    parser.add_argument("--output", default="-", help="file of the JSON report ('-' for stdout)")
+    args = parser.parse_args(argv)
+
+    report = json.dumps(run(args), indent=4)
+    if args.output == "-":
+        print(report)
+    else:
+        with open(args.output, "w") as file:
+            file.write(report)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+""" Micro-benchmark of the product extraction in json mode: soup path against the structured data fast path
+
+Run from the repository root:
+    python -m benchmarks.json_ld_extraction [saved_product_page.html ...]
+
+Without arguments a synthetic product page (big menu, JSON-LD in a @graph) is
+generated. A product with a numeric sku is checked first, it has to come out as
+a string the export accepts, otherwise the exit code is 1. Every timing is single-threaded, so pages/sec is the throughput of
+one core of the parse executor.
+"""
+from bs4 import BeautifulSoup
+import json
+import sys
+import timeit
+import structured_data
+from structured_data import product_from_json_ld_blocks
+from benchmarks.link_extraction import mega_menu_page
+from export import product_sku
+from scraper import LogCollector
+
+REPEATS = 5
+NUMBER = 20
+
+
+def product_page():
+    """ Generate a product page with a mega-menu and its JSON-LD inside a @graph wrapper """
+    json_ld = json.dumps({
+        "@context": "https://schema.org",
+        "@graph": [
+            {"@type": "BreadcrumbList", "itemListElement": [{"@type": "ListItem", "position": i, "name": f"Level {i}"} for i in range(4)]},
+            {
+                "@type": "Product",
+                "name": "Garden Hose 20 m",
+                "sku": "GH-20",
+                "image": [f"https://www.example.com/img/gh-20-{i}.jpg" for i in range(5)],
+                "description": "A sturdy garden hose. " * 40,
+                "offers": [{"@type": "Offer", "price": 29.9, "priceCurrency": "EUR", "url": "https://www.example.com/products/gh-20"}],
+            },
+        ],
+    })
+    menu_page = mega_menu_page()
+    return menu_page.replace("<body>", f'<head><script type="application/ld+json">{json_ld}</script></head><body>', 1)
+
+
+def check_numeric_sku():
+    """ JSON-LD often has numeric skus and names, the exported fields have to be strings anyway """
+    json_ld = json.dumps({"@context": "https://schema.org", "@type": "Product", "name": 4711, "sku": 12345, "offers": {"price": 9.5}})
+    html = f'<html><head><script type="application/ld+json">{json_ld}</script></head><body></body></html>'
+    product = structured_data.extract_structured_product("https://www.example.com/products/4711", html, LogCollector())
+    if not product or product["sku"] != "12345" or product["name"] != "4711" or product_sku(product) != "12345":
+        print(f"  WRONG product of a numeric sku: {product}")
+        return False
+    return True
+
+
+def soup_product(url, soup, log_queue):
+    """ The former json mode extraction, which takes the JSON-LD blocks from a soup of the page """
+    schema_markups = soup.find_all("script", {"type": "application/ld+json"})
+    return product_from_json_ld_blocks(url, (str(markup.string) for markup in schema_markups if markup.string), log_queue)
+
+
+def benchmark(url, html):
+    def soup_path():
+        return soup_product(url, BeautifulSoup(html, 'lxml'), LogCollector())
+
+    def fast_path():
+        return structured_data.extract_structured_product(url, html, LogCollector())
+
+    if soup_path() != fast_path():
+        print(f"  WARNING: results differ (soup {soup_path()}, fast path {fast_path()})")
+
+    timings = {"soup + json": soup_path, "fast path": fast_path}
+    if structured_data.json_loads is not json.loads:
+        # The same fast path with the standard library JSON decoder, to show the share of orjson
+        def fast_path_json():
+            json_loads = structured_data.json_loads
+            structured_data.json_loads = json.loads
+            try:
+                return fast_path()
+            finally:
+                structured_data.json_loads = json_loads
+        timings["fast path (json module)"] = fast_path_json
+
+    print(f"{url} ({len(html) // 1024} KB)")
+    for name, func in timings.items():
+        best = min(timeit.repeat(func, number=NUMBER, repeat=REPEATS)) / NUMBER
+        print(f"  {name:<24} {best * 1000:8.2f} ms {1 / best:10.0f} pages/sec per core")
+
+
+if __name__ == "__main__":
+    pages = []
+    for arg in sys.argv[1:]:
+        url, _, path = arg.rpartition("=") if "=" in arg else ("https://www.example.com/products/", "", arg)
+        with open(path, encoding="utf-8", errors="replace") as file:
+            pages.append((url, file.read()))
+    if not pages:
+        pages.append(("https://www.example.com/products/gh-20", product_page()))
+
+    numeric_sku_ok = check_numeric_sku()
+    print(f"Numeric sku: {'ok' if numeric_sku_ok else 'failed'}")
+    for url, html in pages:
+        benchmark(url, html)
+    sys.exit(0 if numeric_sku_ok else 1)
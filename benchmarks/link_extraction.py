@@ -0,0 +1,103 @@
+""" Micro-benchmark of the link extraction against the former nested-div implementation
+
+Run from the repository root:
+    python -m benchmarks.link_extraction [saved_page.html ...]
+
+Without arguments a synthetic mega-menu page is generated. Saved pages are
+benchmarked with https://www.example.com/ as their page URL, unless the
+file name is given as "url=path", e.g. https://shop.at/=shop_home.html
+"""
+from bs4 import BeautifulSoup
+from urllib.parse import urlparse, urljoin, urlunparse
+import sys
+import timeit
+from constants import GENERAL_BLACKLIST, EXCLUDED_EXTENSIONS, DEFAULT_BLACKLIST
+from parser_backend import LxmlBackend, SoupBackend
+from scraper import Scraper
+
+REPEATS = 5
+
+
+def legacy_get_all_links(url, domain, formatted_blacklist, soup):
+    """ The former get_all_links, which rescans every div/nav/ul/li/span for nested links """
+    links = set()
+
+    parsed_url = urlparse(url)
+    base_url = f"{parsed_url.scheme}://{parsed_url.netloc}"
+
+    def add_link(normalized_link):
+        if (
+            domain in normalized_link
+            and not any(blacklisted_url in normalized_link for blacklisted_url in formatted_blacklist)
+            and not any(general_url in normalized_link for general_url in GENERAL_BLACKLIST)
+            and not normalized_link.endswith(EXCLUDED_EXTENSIONS)
+        ):
+            links.add(normalized_link)
+
+    for a_tag in soup.find_all("a", href=True):
+        full_link = urljoin(base_url, a_tag['href'])
+        add_link(urlunparse(urlparse(full_link)._replace(fragment="")))
+
+    for div in soup.find_all(['div', 'nav', 'ul', 'li', 'span']):
+        for nested_a_tag in div.find_all("a", href=True):
+            full_link = urljoin(base_url, nested_a_tag['href'])
+            add_link(urlunparse(urlparse(full_link)._replace(fragment="")))
+
+    return links
+
+
+def mega_menu_page(categories=12, subcategories=10, leaves=8):
+    """ Generate a page with a deeply nested mega-menu, like the ones of big shops """
+    menu = []
+    for c in range(categories):
+        menu.append(f'<li class="level-1"><span><a href="/c{c}/">Category {c}</a></span><div class="flyout"><ul>')
+        for s in range(subcategories):
+            menu.append(f'<li class="level-2"><div><span><a href="/c{c}/s{s}/">Sub {s}</a></span></div><ul>')
+            for l in range(leaves):
+                menu.append(f'<li class="level-3"><span><a href="/c{c}/s{s}/l{l}/#top">Leaf {l}</a></span></li>')
+            menu.append('</ul></li>')
+        menu.append('</ul></div></li>')
+    footer = ''.join(f'<li><a href="{href}">x</a></li>' for href in ("/account", "/cart", "/kontakt", "mailto:info@example.com", "https://facebook.com/example", "/agb.pdf"))
+    return f'<html><body><nav><ul>{"".join(menu)}</ul></nav><div><div><ul>{footer}</ul></div></div></body></html>'
+
+
+def benchmark(url, html):
+    scraper = Scraper()
+    scraper.adv_settings = {"formatted_blacklist": scraper.str_to_array_by_linebrake(DEFAULT_BLACKLIST)}
+    scraper.compile_blacklist()
+    domain = urlparse(url).netloc
+    log_messages = []
+    soup_backend, lxml_backend = SoupBackend(), LxmlBackend()
+
+    soup = BeautifulSoup(html, 'lxml')
+    legacy_links = legacy_get_all_links(url, domain, scraper.adv_settings["formatted_blacklist"], soup)
+    soup_links = scraper.get_all_links(url, domain, log_messages, soup_backend.hrefs(soup))
+    lxml_links = scraper.get_all_links(url, domain, log_messages, lxml_backend.hrefs(lxml_backend.parse(html)))
+    if not legacy_links == soup_links == lxml_links:
+        print(f"  WARNING: results differ (legacy {len(legacy_links)}, soup {len(soup_links)}, lxml {len(lxml_links)})")
+
+    timings = {
+        # the link extraction alone on an already built soup
+        "legacy (soup given)": lambda: legacy_get_all_links(url, domain, scraper.adv_settings["formatted_blacklist"], soup),
+        "single pass (soup given)": lambda: scraper.get_all_links(url, domain, log_messages, soup_backend.hrefs(soup)),
+        # the whole path from the raw HTML, as used on non-product pages
+        "legacy incl. soup build": lambda: legacy_get_all_links(url, domain, scraper.adv_settings["formatted_blacklist"], BeautifulSoup(html, 'lxml')),
+        "lxml fast path": lambda: scraper.get_all_links(url, domain, log_messages, lxml_backend.hrefs(lxml_backend.parse(html))),
+    }
+    print(f"{url} ({len(html) // 1024} KB, {len(legacy_links)} links)")
+    for name, func in timings.items():
+        best = min(timeit.repeat(func, number=1, repeat=REPEATS))
+        print(f"  {name:<26} {best * 1000:9.2f} ms")
+
+
+if __name__ == "__main__":
+    pages = []
+    for arg in sys.argv[1:]:
+        url, _, path = arg.rpartition("=") if "=" in arg else ("https://www.example.com/", "", arg)
+        with open(path, encoding="utf-8", errors="replace") as file:
+            pages.append((url, file.read()))
+    if not pages:
+        pages.append(("https://www.example.com/", mega_menu_page()))
+
+    for url, html in pages:
+        benchmark(url, html)
@@ -0,0 +1,143 @@
+""" Local mock webshop for reproducible crawl benchmarks
+
+Run it on its own from the repository root, e.g. to try settings in the GUI:
+    python -m benchmarks.mock_shop --pages 2000 --fan-out 20 --latency 0.02 --port 8080
+
+Every third page is a product page (/products/<n>), all others are category
+pages (/category/<n>). Page content and links only depend on the page number,
+so every run crawls exactly the same shop.
+"""
+from aiohttp import web
+import argparse
+import asyncio
+import json
+import random
+
+
+class MockShopConfig:
+    def __init__(self, pages=2000, fan_out=20, latency=0.02, jitter=0.01, error_rate=0.0, markup="json-ld", page_kb=20, seed=1, listing_markup="none"):
+        self.pages = pages
+        self.fan_out = fan_out
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.markup = markup
+        self.page_kb = page_kb
+        self.seed = seed
+        self.listing_markup = listing_markup
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+def page_url(n):
+    return f"/products/{n}" if n % 3 == 0 else f"/category/{n}"
+
+
+def product_price(n):
+    return f"{(n * 7) % 500}.{n % 100:02d}"
+
+
+def product_markup(n, markup):
+    price = product_price(n)
+    if markup == "microdata":
+        return (f'<div itemscope itemtype="https://schema.org/Product"><h1 itemprop="name">Product {n}</h1>'
+                f'<img itemprop="image" src="/img/{n}.jpg"><span itemprop="sku">SKU-{n}</span>'
+                f'<p itemprop="description">Description of product {n}</p>'
+                f'<div itemprop="offers" itemscope itemtype="https://schema.org/Offer"><meta itemprop="price" content="{price}"></div></div>')
+    json_ld = json.dumps({
+        "@context": "https://schema.org",
+        "@type": "Product",
+        "name": f"Product {n}",
+        "image": [f"/img/{n}.jpg"],
+        "description": f"Description of product {n}",
+        "sku": f"SKU-{n}",
+        "offers": {"@type": "Offer", "price": price, "priceCurrency": "EUR"},
+    })
+    return f'<script type="application/ld+json">{json_ld}</script>'
+
+
+def listing_markup(numbers, markup):
+    """ The records of the linked products on a category page, as JSON-LD ItemList, microdata tiles or embedded state """
+    if markup == "json-ld":
+        item_list = {"@context": "https://schema.org", "@type": "ItemList", "itemListElement": [
+            {"@type": "ListItem", "position": position, "item": {
+                "@type": "Product", "name": f"Product {n}", "sku": f"SKU-{n}", "url": page_url(n), "image": f"/img/{n}.jpg",
+                "offers": {"@type": "Offer", "price": product_price(n), "priceCurrency": "EUR"},
+            }} for position, n in enumerate(numbers, 1)]}
+        return f'<script type="application/ld+json">{json.dumps(item_list)}</script>'
+    if markup == "microdata":
+        return "".join(
+            f'<div itemscope itemtype="https://schema.org/Product"><a itemprop="url" href="{page_url(n)}"><span itemprop="name">Product {n}</span></a>'
+            f'<span itemprop="sku">SKU-{n}</span><div itemprop="offers" itemscope itemtype="https://schema.org/Offer">'
+            f'<span itemprop="price">{product_price(n)}</span></div></div>'
+            for n in numbers
+        )
+    if markup == "state":
+        state = {"props": {"pageProps": {"products": [
+            {"title": f"Product {n}", "articleNumber": f"SKU-{n}", "price": {"amount": product_price(n), "currency": "EUR"}, "url": page_url(n)}
+            for n in numbers
+        ]}}}
+        return f'<script id="__NEXT_DATA__" type="application/json">{json.dumps(state)}</script>'
+    return ""
+
+
+def render_page(config, n):
+    """ HTML of page n: a menu of fan_out links, the product markup on product pages (or the listed products) and some filler text """
+    rng = random.Random(config.seed * 1_000_003 + n)
+    numbers = [rng.randrange(config.pages) for _ in range(config.fan_out)]
+    links = "".join(f'<li><a href="{page_url(number)}">Link</a></li>' for number in numbers)
+    if n % 3 == 0:
+        product = product_markup(n, config.markup)
+    else:
+        product = listing_markup([number for number in numbers if number % 3 == 0], config.listing_markup)
+    filler = "<p>" + "Lorem ipsum dolor sit amet. " * (config.page_kb * 1024 // 28) + "</p>"
+    return f'<html><head><title>Page {n}</title></head><body><nav><ul>{links}</ul></nav><main>{product}{filler}</main></body></html>'
+
+
+def create_app(config):
+    rng = random.Random(config.seed)
+
+    async def page(request):
+        n = int(request.match_info.get("n", 0))
+        if n >= config.pages:
+            raise web.HTTPNotFound()
+        await asyncio.sleep(max(0.0, config.latency + rng.uniform(-config.jitter, config.jitter)))
+        if rng.random() < config.error_rate:
+            # Half of the errors are throttling, which the scraper retries
+            return web.Response(status=503 if rng.random() < 0.5 else 500)
+        return web.Response(text=render_page(config, n), content_type="text/html")
+
+    app = web.Application()
+    app.router.add_get("/", page)
+    app.router.add_get("/products/{n:\\d+}", page)
+    app.router.add_get("/category/{n:\\d+}", page)
+    return app
+
+
+def serve(config, port):
+    web.run_app(create_app(config), host="127.0.0.1", port=port, print=None)
+
+
+def add_arguments(parser):
+    parser.add_argument("--pages", type=int, default=2000, help="quantity of pages of the shop, every third one is a product")
+    parser.add_argument("--fan-out", type=int, default=20, help="links per page")
+    parser.add_argument("--latency", type=float, default=0.02, help="response latency [s]")
+    parser.add_argument("--jitter", type=float, default=0.01, help="random +- deviation of the latency [s]")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of responses failing with 500/503")
+    parser.add_argument("--markup", choices=["json-ld", "microdata"], default="json-ld", help="markup of the products")
+    parser.add_argument("--page-kb", type=int, default=20, help="filler text per page [KB]")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the links, latencies and errors")
+    parser.add_argument("--listing-markup", choices=["none", "json-ld", "microdata", "state"], default="none", help="markup of the linked products on category pages")
+
+
+def config_from_args(args):
+    return MockShopConfig(args.pages, args.fan_out, args.latency, args.jitter, args.error_rate, args.markup, args.page_kb, args.seed, args.listing_markup)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local mock webshop for crawl benchmarks.")
+    add_arguments(parser)
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+    serve(config_from_args(args), args.port)
@@ -0,0 +1,129 @@
+""" Conformance check and benchmark of the parser backends of the parse stage
+
+Run from the repository root:
+    python -m benchmarks.parser_backends [saved_page.html ...]
+
+Every page of the corpus is parsed by every available backend, the links and the
+products of html mode (default itemprops and custom selectors) have to be the
+same as the ones of the soup reference, otherwise the differences are printed and
+the exit code is 1. The soup reference selects the elements with BeautifulSoup and
+soupsieve, independently of lxml; only XPath selectors are evaluated by lxml in every
+backend, as nothing else can evaluate them. Saved pages are checked with https://www.example.com/products/
+as their page URL, unless the file name is given as "url=path". Without arguments
+a generated corpus (mega-menu, microdata, meta tags, nested images, rel=canonical,
+broken markup) is used. Every timing is single-threaded, so pages/sec is the
+throughput of one core of the parse executor.
+"""
+import sys
+import timeit
+from benchmarks import mock_shop
+from benchmarks.link_extraction import mega_menu_page
+from parser_backend import PARSER_BACKENDS, create_parser_backend
+from scraper import LogCollector, Scraper
+
+REPEATS = 5
+NUMBER = 10
+
+# The product element settings every page is extracted with: the default itemprops, class names, CSS, XPath and fallbacks
+PROD_ELS_VARIANTS = {
+    "itemprops": {},
+    "class names": {"name": "product-title", "price": "price", "desc": "description", "image": "gallery", "sku": "sku"},
+    "css": {"name": "h1.product-title", "price": "div.buy-box > span.price", "desc": "#details .description", "image": "div.gallery img", "sku": "[data-sku]"},
+    "xpath": {"name": "//h1/text()", "price": "//span[@class='price']", "desc": "", "image": "//div[@class='gallery']", "sku": "//*[@data-sku]/@data-sku"},
+    "fallbacks": {"name": "missing-class || h1", "price": "span.missing || [itemprop='price']", "desc": "", "image": "", "sku": ""},
+}
+
+
+def product_page(n):
+    """ A product page with microdata, a class based layout, nested markup and a rel=canonical """
+    return f"""<!DOCTYPE html><html><head><meta charset="utf-8"><title>Product {n}</title>
+<link rel="Canonical" href="https://www.example.com/products/{n}?utm_source=x">
+<meta property="og:title" content="Product {n}"></head>
+<body><header><nav><ul><li><a href="/category/1">Garden</a></li><li><a href="/category/2#top">Tools</a></li>
+<li><a href="mailto:info@example.com">Mail</a></li><li><a href="/agb.pdf">AGB</a></li><li><a href>Empty</a></li></ul></nav></header>
+<main><div itemscope itemtype="https://schema.org/Product">
+<h1 class="product-title main" itemprop="name">  Garden Hose
+  {n} m &amp; more </h1>
+<div class="gallery"><a href="/img/{n}-big.jpg"><img data-src="/img/{n}.jpg" alt="Hose"></a></div>
+<meta itemprop="image" content="https://www.example.com/img/{n}.jpg">
+<span data-sku="SKU-{n}" itemprop="sku">SKU-{n}</span>
+<div class="buy-box"><span class="price">€ 1.{n:03d},90</span>
+<div itemprop="offers" itemscope itemtype="https://schema.org/Offer"><meta itemprop="price" content="{n}.90"></div></div>
+<div id="details"><div class="description" itemprop="description"><p>Sturdy <b>hose</b><br>for the garden.</p><ul><li>20 m</li></ul></div></div>
+</div><section><a href="/products/{n + 1}">Next</a><a href="https://www.example.com/products/{n + 2}/">Other</a>
+<a href="https://facebook.com/example">Share</a><a href="?page=2&amp;sort=asc">Page 2</a></section></main>
+<p>Unclosed paragraph <div>and a stray </span> tag</body></html>"""
+
+
+def corpus():
+    pages = [("https://www.example.com/", mega_menu_page())]
+    pages += [(f"https://www.example.com/products/{n}", product_page(n)) for n in (7, 42)]
+    config = mock_shop.MockShopConfig(pages=300)
+    for markup in ("json-ld", "microdata"):
+        config.markup = markup
+        pages += [(f"https://www.example.com{mock_shop.page_url(n)}", mock_shop.render_page(config, n)) for n in (3, 4)]
+    return pages
+
+
+def parse_results(scraper, backend, url, html):
+    """ Links and products of a page with every product element setting, like parse_page gets them """
+    document = backend.parse(html)
+    domain = url.split("/")[2]
+    links = scraper.get_all_links(url, domain, LogCollector(), backend.hrefs(document))
+    canonical = backend.canonical_link(document)
+    products = {variant: backend.extract(url, document, prod_els, LogCollector()) for variant, prod_els in PROD_ELS_VARIANTS.items()}
+    return {"links": links, "canonical": canonical, **products}
+
+
+def available_backends():
+    backends = {}
+    for name in PARSER_BACKENDS:
+        try:
+            backends[name] = create_parser_backend(name)
+        except ImportError as e:
+            print(f"{name}: not available ({e})")
+    return backends
+
+
+def check(scraper, backends, pages):
+    """ Compare every backend against the soup reference, return the quantity of differences """
+    differences = 0
+    for url, html in pages:
+        reference = parse_results(scraper, backends["soup"], url, html)
+        for name, backend in backends.items():
+            if name == "soup":
+                continue
+            results = parse_results(scraper, backend, url, html)
+            for key, expected in reference.items():
+                if results[key] != expected:
+                    differences += 1
+                    print(f"  DIFFERENCE {name} {url} {key}:\n    soup: {expected}\n    {name}: {results[key]}")
+    return differences
+
+
+def benchmark(scraper, backends, pages):
+    for url, html in pages:
+        print(f"{url} ({len(html) // 1024} KB)")
+        for name, backend in backends.items():
+            best = min(timeit.repeat(lambda: parse_results(scraper, backend, url, html), number=NUMBER, repeat=REPEATS)) / NUMBER
+            print(f"  {name:<12} {best * 1000:8.2f} ms {1 / best:10.0f} pages/sec per core")
+
+
+if __name__ == "__main__":
+    pages = []
+    for arg in sys.argv[1:]:
+        url, _, path = arg.rpartition("=") if "=" in arg else ("https://www.example.com/products/", "", arg)
+        with open(path, encoding="utf-8", errors="replace") as file:
+            pages.append((url, file.read()))
+    if not pages:
+        pages = corpus()
+
+    scraper = Scraper()
+    scraper.adv_settings = {"formatted_blacklist": ["/cart"]}
+    scraper.compile_blacklist()
+    backends = available_backends()
+
+    differences = check(scraper, backends, pages)
+    print(f"Conformance: {len(pages)} pages, {differences} differences to the soup reference.")
+    benchmark(scraper, backends, pages)
+    sys.exit(1 if differences else 0)
@@ -0,0 +1,128 @@
+from collections import Counter
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import re
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+# session IDs as path parameters, e.g. /product;jsessionid=0A1B2C
+SESSION_PATH_PATTERN = re.compile(r";(jsessionid|phpsessid|sid|sessionid)=[^/?#]*", re.IGNORECASE)
+
+DIGITS_PATTERN = re.compile(r"\d+")
+
+# dates in a path or query, e.g. /events/2024/05/ or ?date=2024-05-01, the typical endless calendar
+DATE_PATTERN = re.compile(r"(?:19|20)\d\d[-/_.]?(?:0[1-9]|1[0-2])(?!\d)")
+CALENDAR_PARAMS = {"date", "day", "month", "year", "week", "calendar"}
+
+
+def compile_param_pattern(params):
+    """ Compile query parameter names into one case-insensitive regex, a trailing * matches any suffix """
+    if not params:
+        return None
+    alternatives = [re.escape(param[:-1]) + ".*" if param.endswith("*") else re.escape(param) for param in params]
+    return re.compile(f"^(?:{'|'.join(alternatives)})$", re.IGNORECASE)
+
+
+class Canonicalizer:
+    """ Turns the URL variants of the same page into one canonical URL, so each page only gets enqueued once """
+
+    def __init__(self, allowlist, denylist, trailing_slash):
+        self.allow_pattern = compile_param_pattern(allowlist)
+        self.deny_pattern = compile_param_pattern(denylist)
+        self.trailing_slash = trailing_slash
+
+    def canonicalize(self, url):
+        """ Lowercase scheme and host, drop default port, fragment, session IDs and denied query parameters, sort the rest """
+        parsed = urlsplit(url)
+        scheme = parsed.scheme.lower()
+        try:
+            port = parsed.port
+        except ValueError:
+            return urlunsplit(parsed._replace(fragment=""))
+        netloc = (parsed.hostname or "").lower()
+        if ":" in netloc:
+            netloc = f"[{netloc}]"
+        if port and DEFAULT_PORTS.get(scheme) != port:
+            netloc = f"{netloc}:{port}"
+
+        path = SESSION_PATH_PATTERN.sub("", parsed.path) or "/"
+        if path != "/":
+            if self.trailing_slash == "strip":
+                path = path.rstrip("/") or "/"
+            elif self.trailing_slash == "add" and not path.endswith("/") and "." not in path.rsplit("/", 1)[-1]:
+                path += "/"
+
+        query = ""
+        if parsed.query:
+            params = [
+                (key, value) for key, value in parse_qsl(parsed.query, keep_blank_values=True)
+                if not (self.deny_pattern and self.deny_pattern.match(key))
+                and (not self.allow_pattern or self.allow_pattern.match(key))
+            ]
+            query = urlencode(sorted(params))
+
+        return urlunsplit((scheme, netloc, path, query, ""))
+
+
+def canonical_link(document):
+    """ The href of the <link rel="canonical"> of a page's lxml tree, or None """
+    for link in document.iterfind(".//link[@rel]"):
+        if "canonical" in link.get("rel").lower().split() and link.get("href"):
+            return link.get("href").strip()
+    return None
+
+
+def url_pattern(parsed):
+    """ The URL with its numbers and query values masked, e.g. /shoes/page/{n}?color= """
+    path = DIGITS_PATTERN.sub("{n}", parsed.path)
+    params = sorted({key for key, _ in parse_qsl(parsed.query, keep_blank_values=True)})
+    return f"{parsed.netloc}{path}" + (f"?{'&'.join(f'{param}=' for param in params)}" if params else "")
+
+
+class TrapDetector:
+    """ Stops crawl traps like endless calendars, pagination and filter combinations with page budgets per URL pattern """
+
+    def __init__(self, product_identifier, pattern_budget, calendar_budget, max_path_depth):
+        self.product_identifier = product_identifier
+        self.pattern_budget = pattern_budget
+        self.calendar_budget = calendar_budget
+        self.max_path_depth = max_path_depth
+        self.counts = Counter()
+        self.skipped = Counter()
+
+    def check(self, url):
+        """ Count a new URL against the budget of its pattern, returns the reason if it is a suspected trap, else None """
+        parsed = urlsplit(url)
+        segments = [segment for segment in parsed.path.split("/") if segment]
+
+        if self.max_path_depth and len(segments) > self.max_path_depth:
+            return self.skip(f"path deeper than {self.max_path_depth}")
+
+        # The same path segment over and over again, e.g. relative links resolved against themselves
+        repeated = Counter(segment for segment in segments if not segment.isdigit())
+        if repeated and max(repeated.values()) >= 3:
+            return self.skip("repeated path segments")
+
+        # Product pages are never a trap, they only share their pattern
+        if self.product_identifier and self.product_identifier in url:
+            return None
+
+        pattern = url_pattern(parsed)
+        query_params = {key.lower() for key, _ in parse_qsl(parsed.query)}
+        calendar = DATE_PATTERN.search(parsed.path) or DATE_PATTERN.search(parsed.query) or query_params & CALENDAR_PARAMS
+        budget = self.calendar_budget if calendar else self.pattern_budget
+        if budget:
+            self.counts[pattern] += 1
+            if self.counts[pattern] > budget:
+                return self.skip(pattern)
+        return None
+
+    def skip(self, reason):
+        self.skipped[reason] += 1
+        return reason
+
+    def summary(self):
+        skipped = sum(self.skipped.values())
+        if not skipped:
+            return "Crawl traps: none detected."
+        top = ", ".join(f"{reason} ({count})" for reason, count in self.skipped.most_common(3))
+        return f"Crawl traps: {skipped} URLs skipped, mostly {top}."
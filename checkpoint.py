@@ -0,0 +1,82 @@
+import sqlite3
+
+
+class CrawlCheckpoint:
+    """ SQLite checkpoint of a crawl: the frontier, the visited URLs and the URLs already exported to the CSV file """
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        # state 0 = enqueued, state 1 = visited
+        self.db.execute("CREATE TABLE IF NOT EXISTS urls (url TEXT PRIMARY KEY, state INTEGER NOT NULL)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS exported (url TEXT PRIMARY KEY)")
+        self.db.commit()
+
+        # Changes since the last checkpoint, written in one transaction by save()
+        self.pending_enqueued = []
+        self.pending_visited = []
+        self.pending_exported = []
+        self.exported = set()
+
+    def can_resume(self, start_url):
+        """ True if the checkpoint belongs to an unfinished crawl of the same start URL """
+        return self.get_meta("start_url") == start_url and self.get_meta("finished") != "1"
+
+    def start(self, start_url):
+        """ Throw away any previous state and begin a new crawl """
+        self.db.execute("DELETE FROM meta")
+        self.db.execute("DELETE FROM urls")
+        self.db.execute("DELETE FROM exported")
+        self.db.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", [("start_url", start_url), ("finished", "0")])
+        self.db.commit()
+        self.exported = set()
+
+    def load(self):
+        """ Return (pending, visited_count) of the checkpointed crawl and load the exported URLs """
+        pending = [url for (url,) in self.db.execute("SELECT url FROM urls WHERE state = 0")]
+        visited_count = self.db.execute("SELECT COUNT(*) FROM urls WHERE state = 1").fetchone()[0]
+        self.exported = {url for (url,) in self.db.execute("SELECT url FROM exported")}
+        return pending, visited_count
+
+    def iter_enqueued(self):
+        """ Yield every URL ever enqueued, to fill the seen-URL store again """
+        for (url,) in self.db.execute("SELECT url FROM urls"):
+            yield url
+
+    def add_enqueued(self, urls):
+        self.pending_enqueued.extend(urls)
+
+    def add_visited(self, url):
+        self.pending_visited.append(url)
+
+    def add_exported(self, url):
+        self.exported.add(url)
+        self.pending_exported.append(url)
+
+    def is_exported(self, url):
+        return url in self.exported
+
+    def take_changes(self):
+        """ Hand over the changes since the last checkpoint, later changes go into the next one """
+        changes = (self.pending_enqueued, self.pending_visited, self.pending_exported)
+        self.pending_enqueued = []
+        self.pending_visited = []
+        self.pending_exported = []
+        return changes
+
+    def save(self, finished=False, changes=None):
+        """ Write the taken changes (all changes since the last checkpoint by default) in one transaction """
+        enqueued, visited, exported = changes or self.take_changes()
+        with self.db:
+            self.db.executemany("INSERT OR IGNORE INTO urls (url, state) VALUES (?, 0)", ((url,) for url in enqueued))
+            self.db.executemany("INSERT OR REPLACE INTO urls (url, state) VALUES (?, 1)", ((url,) for url in visited))
+            self.db.executemany("INSERT OR IGNORE INTO exported (url) VALUES (?)", ((url,) for url in exported))
+            if finished:
+                self.db.execute("UPDATE meta SET value = '1' WHERE key = 'finished'")
+
+    def get_meta(self, key):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def close(self):
+        self.db.close()
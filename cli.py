@@ -0,0 +1,231 @@
+""" Headless command line entry point, crawls many shops in one process
+
+Takes the settings files exported in the advanced settings of the GUI:
+    python cli.py shop_a.json shop_b.json --concurrency 100 --output-dir /data/scrapes
+
+Distributed mode, start the same command on every worker node and merge the shards at the end:
+    python cli.py shop_a.json --frontier redis://redis-host:6379/0 --output-dir /shared/scrapes
+    python cli.py shop_a.json --merge --output-dir /shared/scrapes
+A new job of the same shop on the same frontier clears it first, before any worker gets started:
+    python cli.py shop_a.json --frontier redis://redis-host:6379/0 --reset
+
+Record the crawl and re-extract it offline later, e.g. after fixing the product elements:
+    python cli.py shop_a.json --record --output-dir /data/scrapes
+    python cli.py shop_a.json --replay --output-dir /data/scrapes
+
+Exit codes: 0 all shops finished, 1 at least one shop failed,
+2 invalid command line, 3 all shops ran but at least one found no products
+or was stopped by --max-duration. In delta mode the unchanged products count
+as found, so an unchanged shop exits 0 without exporting anything.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from constants import SIMULTANEOUS_SCRAPS, DEFAULT_BLACKLIST, EXPORT_FORMATS, HTTP_CACHE, HTTP_CACHE_DIR, HTTP_CACHE_MAX_SIZE, HTTP_CACHE_MAX_AGE, HTTP_CACHE_MAX_PENDING, METRICS_PORT, METRICS_DUMP_INTERVAL
+from distributed import merge_shards, reset_frontier
+from http_cache import HttpCache
+from metrics import Metrics, MetricsReporter
+from scraper import Scraper
+from transport import create_session, TransportStats
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_INCOMPLETE = 3
+
+
+class ConsoleLog:
+    """ Stands in for the log_queue of the GUI and prints the messages of one shop, the progress snapshots only if verbose """
+
+    def __init__(self, name, verbose):
+        self.name = name
+        self.verbose = verbose
+
+    def put(self, message):
+        if self.verbose or not message.startswith("Visited:"):
+            print(f"[{self.name}] {message}", flush=True)
+
+
+def load_settings(path, args, concurrency):
+    """ Turn an exported settings file into the settings and adv_settings of a Scraper """
+    with open(path, 'r') as file:
+        loaded_data = json.load(file)
+
+    settings = loaded_data.get("settings", {})
+    adv_settings = loaded_data.get("adv_settings", {})
+    name = os.path.splitext(os.path.basename(path))[0]
+
+    return name, {
+        "url": settings.get("url", ""),
+        "mode": settings.get("mode", "html"),
+        "product_identifier": settings.get("product_identifier", ""),
+        "prod_els": {
+            "name": settings.get("prod_name", ""),
+            "sku": settings.get("prod_sku", ""),
+            "price": settings.get("prod_price", ""),
+            "desc": settings.get("prod_desc", ""),
+            "image": settings.get("prod_image", ""),
+        },
+        "discovery": settings.get("discovery", "crawl"),
+        "sitemap_since": settings.get("sitemap_since") or None,
+        "listing": bool(settings.get("listing")) or args.listing,
+        "resume": args.resume,
+        "delta": args.delta,
+        "archive": args.record,
+        "replay": args.replay,
+        "output_dir": args.output_dir,
+        "output_name": name,
+        "export_formats": args.formats,
+        "concurrency": concurrency,
+        "parser_backend": args.parser,
+        "frontier_backend": args.frontier,
+        "log_queue": ConsoleLog(name, args.verbose),
+    }, {"blacklist": adv_settings.get("blacklist", DEFAULT_BLACKLIST)}
+
+
+async def run_shop(name, scraper, session, parse_executor, http_cache, metrics, max_duration):
+    """ Run a single shop and return its summary """
+    started = time.monotonic()
+    timer = asyncio.get_running_loop().call_later(max_duration, scraper.stop_flag.set) if max_duration else None
+
+    error = None
+    try:
+        await scraper.start_scraping(session=session, parse_executor=parse_executor, http_cache=http_cache, metrics=metrics)
+    except Exception as e:
+        logging.exception(f"Scraping {name} failed")
+        error = f"{e.__class__.__name__}: {e}"
+    finally:
+        if timer:
+            timer.cancel()
+
+    return {
+        "shop": name,
+        "url": scraper.settings["url"],
+        "status": "failed" if error or not scraper.is_valid_url(scraper.settings["url"]) else "finished" if scraper.job_finished else "stopped",
+        "error": error,
+        "pages": scraper.visited_count,
+        "products": scraper.product_qty,
+        "unchanged": scraper.unchanged_qty,
+        "seconds": round(time.monotonic() - started, 1),
+    }
+
+
+async def run_shops(args):
+    # Split the global concurrency budget evenly across the shops
+    concurrency = max(1, args.concurrency // len(args.settings_files))
+
+    scrapers = []
+    for path in args.settings_files:
+        name, settings, adv_settings = load_settings(path, args, concurrency)
+        scraper = Scraper()
+        scraper.settings = settings
+        scraper.adv_settings = adv_settings
+        scrapers.append((name, scraper))
+
+    # All shops share one event loop, one connection pool, one parse executor, one HTTP cache and the metrics
+    stats = TransportStats()
+    parse_executor = scrapers[0][1].create_parse_executor()
+    http_cache = HttpCache(HTTP_CACHE_DIR, HTTP_CACHE_MAX_SIZE, HTTP_CACHE_MAX_AGE, HTTP_CACHE_MAX_PENDING) if HTTP_CACHE else None
+    metrics = Metrics() if args.metrics else None
+    reporter = None
+    if metrics:
+        reporter = MetricsReporter(metrics, METRICS_PORT, os.path.join(args.output_dir, "metrics.json"), METRICS_DUMP_INTERVAL)
+        await reporter.start()
+    try:
+        # The connection pool is sized for the global concurrency, every shop's limiter for its share
+        async with create_session(stats, metrics, args.concurrency) as session:
+            summaries = await asyncio.gather(*(run_shop(name, scraper, session, parse_executor, http_cache, metrics, args.max_duration) for name, scraper in scrapers))
+    finally:
+        if parse_executor:
+            parse_executor.shutdown(cancel_futures=True)
+        if http_cache:
+            http_cache.close()
+        if reporter:
+            await reporter.close()
+
+    return summaries, stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Crawl one or many shops without GUI, using settings files exported from the GUI.")
+    parser.add_argument("settings_files", nargs="+", help="settings .json files exported in the advanced settings")
+    parser.add_argument("--concurrency", type=int, default=SIMULTANEOUS_SCRAPS, help="global quantity of simultaneous scraping tasks, split across all shops")
+    parser.add_argument("--output-dir", default=".", help="folder of the output files, created if missing (default: the current folder)")
+    parser.add_argument("--formats", default=",".join(EXPORT_FORMATS), help="comma separated export formats: csv, jsonl, parquet, sqlite")
+    parser.add_argument("--resume", action="store_true", help="resume unfinished crawls from their checkpoints")
+    parser.add_argument("--delta", action="store_true", help="only export the products changed since the last run and write a change feed")
+    parser.add_argument("--listing", action="store_true", help="export the products of the category pages and only fetch the detail pages with missing fields")
+    parser.add_argument("--record", action="store_true", help="record the fetched pages into <output>.warc.gz for a replay")
+    parser.add_argument("--replay", action="store_true", help="re-extract the products of the recorded pages of the last --record run, without any request")
+    parser.add_argument("--max-duration", type=float, default=None, help="stop every shop after the given seconds")
+    parser.add_argument("--summary-json", default=None, help="write the summary of all shops as JSON to this file ('-' for stdout)")
+    parser.add_argument("--log-file", default=None, help="write the extended log into this file")
+    parser.add_argument("--verbose", action="store_true", help="print the progress snapshots")
+    parser.add_argument("--parser", choices=["lxml", "selectolax", "soup"], default=None, help="HTML parser of the parse stage (default: PARSER_BACKEND)")
+    parser.add_argument("--metrics", action="store_true", help="time the stages of every page, served on METRICS_PORT and dumped to metrics.json in the output folder")
+    parser.add_argument("--frontier", default=None, help="distributed mode: shared frontier, redis://host:6379/0 or sqlite:///path/frontier.sqlite3")
+    parser.add_argument("--reset", action="store_true", help="clear the shared frontier of the shops for a new job instead of crawling (needs --frontier)")
+    parser.add_argument("--merge", action="store_true", help="merge the output shards of the distributed workers instead of crawling")
+    args = parser.parse_args(argv)
+    args.formats = [export_format.strip() for export_format in args.formats.split(",") if export_format.strip()]
+
+    for path in args.settings_files:
+        if not os.path.isfile(path):
+            parser.error(f"settings file not found: {path}")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    if args.log_file:
+        logging.basicConfig(filename=args.log_file, level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    else:
+        logging.basicConfig(level=logging.CRITICAL)
+
+    if args.resume and args.frontier:
+        parser.error("--resume is not available with --frontier, the shared frontier keeps the state of the job")
+    if args.reset:
+        if not args.frontier:
+            parser.error("--reset needs --frontier")
+        # The seen URLs of the last job stay in the shared frontier, a new job would find its start URL seen already
+        for path in args.settings_files:
+            name, settings, _ = load_settings(path, args, args.concurrency)
+            asyncio.run(reset_frontier(args.frontier, Scraper().canonicalizer.canonicalize(settings["url"])))
+            print(f"{name}: shared frontier cleared")
+        return EXIT_OK
+
+    if args.merge:
+        # Merge the shards of all distributed workers into one output per shop
+        for path in args.settings_files:
+            name = os.path.splitext(os.path.basename(path))[0]
+            merged = merge_shards(args.output_dir, name)
+            print(f"{name}: merged {', '.join(merged) if merged else 'no shards'}")
+        return EXIT_OK
+
+    summaries, stats = asyncio.run(run_shops(args))
+
+    # Summary for humans and, optionally, for the automation
+    for summary in summaries:
+        print(f"{summary['shop']}: {summary['status']} | {summary['pages']} pages | {summary['products']} products"
+              + (f" | {summary['unchanged']} unchanged" if summary["unchanged"] else "") + f" | {summary['seconds']} s"
+              + (f" | {summary['error']}" if summary["error"] else ""))
+    print(stats.summary())
+
+    if args.summary_json:
+        report = json.dumps({"shops": summaries}, indent=4)
+        if args.summary_json == "-":
+            print(report)
+        else:
+            with open(args.summary_json, 'w') as file:
+                file.write(report)
+
+    if any(summary["status"] == "failed" for summary in summaries):
+        return EXIT_FAILED
+    if any(summary["status"] != "finished" or not (summary["products"] or summary["unchanged"]) for summary in summaries):
+        return EXIT_INCOMPLETE
+    return EXIT_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
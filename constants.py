@@ -1,3 +1,5 @@
+import os
+
 # speed test mode (runs the program for the given minutes and stops after, while also prompting the Average CPU and Max Memory Usafe)
 SPEED_TEST_MODE = False
 SPEED_TEST_DURATION = 5 * 60
@@ -5,12 +7,135 @@ SPEED_TEST_DURATION = 5 * 60
 # set the quantity of simultaneous scraping tasks (depending on your CPU power and the target website server)
 SIMULTANEOUS_SCRAPS = 50
 
+# set where the HTML parsing runs: "process" (ProcessPoolExecutor, uses all CPU cores), "thread" (ThreadPoolExecutor) or "inline" (on the event loop)
+PARSE_EXECUTOR = "process"
+
+# set the quantity of parse workers (None uses the number of CPU cores)
+PARSE_WORKERS = None
+
+# set the interval in which the frontier, the visited and the exported URLs are checkpointed to disk for resuming a crawl [s]
+CHECKPOINT_INTERVAL = 30
+
+# set the store of already enqueued URLs: "set" (full URL strings), "hash" (64-bit hashes, about 16 bytes per URL),
+# "bloom" (scalable Bloom filter, smallest but skips unseen URLs at the false positive rate) or "disk" (hashes, spilled to disk beyond 1M URLs)
+SEEN_STORE = "hash"
+BLOOM_FALSE_POSITIVE_RATE = 0.0001
+
+# per host rate limiting: the request rate [requests/s] and the concurrency start at the initial values and adapt (AIMD)
+# they increase additively per round trip of healthy responses and decrease multiplicatively on 429/503 (respecting Retry-After), timeouts and slow responses
+HOST_INITIAL_RATE = 10
+HOST_MAX_RATE = 200
+HOST_INITIAL_CONCURRENCY = 10
+# (the max concurrency per host follows the concurrency of a job, e.g. --concurrency on the command line)
+HOST_MAX_CONCURRENCY = SIMULTANEOUS_SCRAPS
+
+# responses slower than this count as a sign of an overloaded server [s]
+SLOW_RESPONSE_THRESHOLD = 5
+
 # set the timeout for the response of the session.get call to the target website [s]
 RESPONSE_TIMEOUT = 20
 
+# streamed responses: only pages with an HTML Content-Type (or none at all) are read, in chunks of READ_CHUNK_SIZE [bytes],
+# a page larger than MAX_PAGE_SIZE [bytes] gets aborted, so downloads, images and feeds never end up in memory
+HTML_CONTENT_TYPES = ["text/html", "application/xhtml+xml"]
+READ_CHUNK_SIZE = 64 * 1024
+MAX_PAGE_SIZE = 10 * 1024 * 1024
+
+# connection pool of the HTTP session: total and per host connections (unless the session is created for the concurrency of a job),
+# DNS cache TTL [s], keep-alive of idle connections [s] and connect timeout [s]
+CONNECTION_LIMIT = SIMULTANEOUS_SCRAPS
+CONNECTION_LIMIT_PER_HOST = HOST_MAX_CONCURRENCY
+DNS_CACHE_TTL = 300
+KEEPALIVE_TIMEOUT = 30
+CONNECT_TIMEOUT = 10
+
+# use the optional HTTP/2 backend (requires "pip install httpx[http2]")
+HTTP2 = False
+
 # set the retries of the same URL after timeout#
 RESPONSE_RETRY = 3
 
+# keep an on-disk cache of the responses, which get revalidated with If-None-Match / If-Modified-Since on the next run
+HTTP_CACHE = False
+HTTP_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".webshop_scraper_cache")
+
+# set the max size of the HTTP cache [MB] (least recently used responses get evicted first) and the max age of its entries [days]
+HTTP_CACHE_MAX_SIZE = 1024
+HTTP_CACHE_MAX_AGE = 30
+
+# set the max quantity of fetched pages waiting to be written into the HTTP cache, a crawl faster than the disk waits for it
+# instead of piling up the pages in memory
+HTTP_CACHE_MAX_PENDING = 64
+
+# listing extraction: fields a product record of a category page needs, so its detail page doesn't have to be fetched
+LISTING_REQUIRED_FIELDS = ["name", "price", "sku"]
+
+# HTML parser of the parse stage: "lxml" (default), "selectolax" (lexbor engine, about 1.2-1.5x faster than lxml, requires "pip install selectolax")
+# or "soup" (BeautifulSoup, the slow reference), all give the same products and links; the delta fingerprints of html mode differ between them
+PARSER_BACKEND = "lxml"
+
+# export of the found products: output folder, formats ("csv", "jsonl" (gzip), "parquet" (requires pyarrow), "sqlite" (upsert on SKU)),
+# the batch size and flush interval [s] of the writes, and whether products with an already exported SKU are skipped
+EXPORT_DIR = os.path.join(os.path.expanduser("~"), "Desktop")
+EXPORT_FORMATS = ["csv"]
+EXPORT_BATCH_SIZE = 500
+EXPORT_FLUSH_INTERVAL = 5
+EXPORT_DEDUP_SKU = True
+
+# order of the frontier: "priority" (product pages first, then listing pages and paths with a high product yield) or "fifo" (breadth-first)
+FRONTIER_ORDER = "priority"
+
+# URL pattern learner: learns per path template (numbers and IDs masked) and depth how many new product links a page brings up,
+# saved per shop next to the output (.patterns.json) for the next run. Templates visited at least PRUNE_MIN_PAGES times whose yield is below
+# PRUNE_YIELD_THRESHOLD times the shop wide yield are "deprioritize"d (fetched last), "drop"ped (every PRUNE_EXPLORE_EVERY-th URL is still fetched,
+# in case the shop changed) or kept with "off"
+URL_PRUNING = "deprioritize"
+PRUNE_MIN_PAGES = 30
+PRUNE_YIELD_THRESHOLD = 0.1
+PRUNE_EXPLORE_EVERY = 20
+
+# URL canonicalization: query parameters dropped from every found URL (case-insensitive, a trailing * matches any suffix),
+# optionally an allowlist of the only query parameters to keep (None keeps all not denied), and the trailing slash rule: "keep", "strip" or "add"
+QUERY_PARAM_DENYLIST = ["utm_*", "gclid", "fbclid", "msclkid", "mc_cid", "mc_eid", "_ga", "sid", "sessionid", "phpsessid", "jsessionid", "sort", "order", "orderby", "dir", "view", "limit"]
+QUERY_PARAM_ALLOWLIST = None
+TRAILING_SLASH = "keep"
+
+# crawl trap detection: max pages enqueued per URL pattern (the URL with its numbers and query values masked, product pages excluded),
+# max pages per calendar-like pattern (dates in the URL) and max path depth (0 disables a rule)
+PATTERN_PAGE_BUDGET = 2000
+CALENDAR_PAGE_BUDGET = 100
+MAX_PATH_DEPTH = 15
+
+# log output: interval of the progress snapshots [s], how often the same message (URLs and numbers masked) is shown before it only gets counted,
+# and the max lines kept in the log window of the GUI
+LOG_SNAPSHOT_INTERVAL = 2
+LOG_REPEAT_LIMIT = 3
+LOG_MAX_LINES = 1000
+
+# set the max quantity of messages waiting for the log window of the GUI, the log pipeline drops and counts further ones
+LOG_QUEUE_SIZE = 10000
+
+# opt-in metrics: timers of the stages of every page (queue wait, DNS, connect, download, parse, extraction, links, export) and counters
+# of the status codes, retries and bytes, served in the Prometheus text format on the port (None disables) and dumped as JSON next to the output [s]
+METRICS = False
+METRICS_PORT = 9100
+METRICS_DUMP_INTERVAL = 30
+
+# profile the first pages of a job with cProfile into <output>.prof (0 disables), these pages are parsed on the event loop to be included
+PROFILE_PAGES = 0
+
+# record the fetched pages into a WARC archive next to the output (<output>.warc.gz), which a replay re-extracts offline on all
+# CPU cores (e.g. after fixing the product elements), and the pages per task handed to a parse worker of the replay
+ARCHIVE = False
+REPLAY_CHUNK_SIZE = 200
+
+# set the max quantity of fetched pages waiting to be compressed into the archive, a crawl faster than the archive waits for it
+# instead of piling up the pages in memory
+ARCHIVE_MAX_PENDING = 64
+
+# distributed mode: seconds a worker may hold a leased URL, before it is handed out to another worker (e.g. after a crash)
+LEASE_SECONDS = 300
+
 # General blacklist components
 GENERAL_BLACKLIST = ["facebook.com", "twitter.com", "instagram.com", "linkedin.com", "youtube.com", "pinterest.com", "mailto", "tel"]
 
@@ -0,0 +1,119 @@
+from datetime import datetime
+import hashlib
+import json
+import sqlite3
+from structured_data import iter_json_ld
+
+
+def page_fingerprint(response_text, mode, main_html=None):
+    """ Fingerprint of the product content of a page: its JSON-LD blocks in json mode, the HTML of its main content in html mode """
+    if mode == "json" or main_html is None:
+        # Pages with microdata or OpenGraph only are fingerprinted as a whole
+        content = "".join(iter_json_ld(response_text)) or response_text
+    else:
+        content = main_html
+    return hashlib.blake2b(content.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def product_fingerprint(product_info):
+    """ Fingerprint of a product record taken from a listing page, whose detail page is not fetched """
+    content = json.dumps(product_info, sort_keys=True, ensure_ascii=False)
+    return hashlib.blake2b(content.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class DeltaStore:
+    """ Fingerprints of all product pages of a shop, used to skip unchanged pages and to write a change feed """
+
+    def __init__(self, path, change_feed_path, resume):
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS products (url TEXT PRIMARY KEY, fingerprint TEXT, sku TEXT, name TEXT, price TEXT, last_seen_run INTEGER)")
+        self.db.commit()
+
+        # A resumed job continues the run of the interrupted one
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'run'").fetchone()
+        self.run = int(row[0]) if row else 0
+        if not resume:
+            self.run += 1
+            self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('run', ?)", (str(self.run),))
+            self.db.commit()
+
+        self.fingerprints = dict(self.db.execute("SELECT url, fingerprint FROM products"))
+        self.pending_writes = 0
+        self.unchanged = 0
+        self.failed = 0
+        self.changes = {"added": 0, "changed": 0, "price_changed": 0, "removed": 0}
+        self.change_feed = open(change_feed_path, 'a' if resume else 'w', encoding='utf-8')
+
+    def fingerprint(self, url):
+        return self.fingerprints.get(url)
+
+    def touch(self, url):
+        """ The page is unchanged, only remember that it still exists """
+        self.unchanged += 1
+        self.db.execute("UPDATE products SET last_seen_run = ? WHERE url = ?", (self.run, url))
+        self.commit_periodically()
+
+    def keep(self, url):
+        """ The page couldn't be fetched in this run (e.g. a 5xx or a timeout), so it is not told removed at the end """
+        if url not in self.fingerprints:
+            return
+        self.failed += 1
+        self.db.execute("UPDATE products SET last_seen_run = ? WHERE url = ?", (self.run, url))
+        self.commit_periodically()
+
+    def record(self, url, fingerprint, product_info):
+        """ Store the new fingerprint of a page and write its change into the change feed """
+        previous = self.db.execute("SELECT price FROM products WHERE url = ?", (url,)).fetchone()
+        if previous is None:
+            self.write_change("added", url, product_info, new_price=product_info.get("price"))
+        elif previous[0] != product_info.get("price"):
+            self.write_change("price_changed", url, product_info, old_price=previous[0], new_price=product_info.get("price"))
+        else:
+            self.write_change("changed", url, product_info, new_price=product_info.get("price"))
+
+        self.fingerprints[url] = fingerprint
+        self.db.execute(
+            "INSERT OR REPLACE INTO products (url, fingerprint, sku, name, price, last_seen_run) VALUES (?, ?, ?, ?, ?, ?)",
+            (url, fingerprint, product_info.get("sku"), product_info.get("name"), product_info.get("price"), self.run),
+        )
+        self.commit_periodically()
+
+    def finish(self):
+        """ After a complete crawl: every product not seen in this run has been removed from the shop """
+        removed = self.db.execute("SELECT url, sku, name, price FROM products WHERE last_seen_run < ?", (self.run,)).fetchall()
+        for url, sku, name, price in removed:
+            self.write_change("removed", url, {"sku": sku, "name": name}, old_price=price)
+            self.fingerprints.pop(url, None)
+        self.db.execute("DELETE FROM products WHERE last_seen_run < ?", (self.run,))
+        self.db.commit()
+
+    def write_change(self, change, url, product_info, old_price=None, new_price=None):
+        self.changes[change] += 1
+        self.change_feed.write(json.dumps({
+            "change": change,
+            "url": url,
+            "sku": product_info.get("sku"),
+            "name": product_info.get("name"),
+            "old_price": old_price,
+            "new_price": new_price,
+            "time": datetime.now().isoformat(timespec="seconds"),
+        }, ensure_ascii=False) + "\n")
+
+    def commit_periodically(self):
+        """ Commit every 100 writes, so an interrupted crawl doesn't lose its fingerprints """
+        self.pending_writes += 1
+        if self.pending_writes >= 100:
+            self.db.commit()
+            self.change_feed.flush()
+            self.pending_writes = 0
+
+    def summary(self):
+        return (f"Delta: {self.unchanged} unchanged | {self.changes['added']} added | {self.changes['price_changed']} price changed | "
+                f"{self.changes['changed']} changed | {self.changes['removed']} removed"
+                + (f" | {self.failed} kept after a failed fetch." if self.failed else "."))
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+        self.change_feed.close()
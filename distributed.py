@@ -0,0 +1,224 @@
+from urllib.parse import urlparse
+import csv
+import glob
+import gzip
+import json
+import os
+import shutil
+import sqlite3
+import time
+
+# Redis Lua scripts, so adding, leasing and requeueing are atomic across all workers
+ADD_SCRIPT = """
+local added = 0
+for _, url in ipairs(ARGV) do
+    if redis.call('SADD', KEYS[1], url) == 1 then
+        redis.call('RPUSH', KEYS[2], url)
+        added = added + 1
+    end
+end
+return added
+"""
+
+LEASE_SCRIPT = """
+local urls = redis.call('LPOP', KEYS[1], ARGV[1])
+if not urls then return {} end
+for _, url in ipairs(urls) do
+    redis.call('ZADD', KEYS[2], ARGV[2], url)
+end
+return urls
+"""
+
+REQUEUE_SCRIPT = """
+local urls = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+for _, url in ipairs(urls) do
+    redis.call('ZREM', KEYS[1], url)
+    redis.call('RPUSH', KEYS[2], url)
+end
+return #urls
+"""
+
+
+class RedisFrontier:
+    """ Frontier and seen-set shared by all workers in a Redis compatible store (requires the redis package, Redis >= 6.2) """
+
+    def __init__(self, uri, name):
+        import redis.asyncio
+        self.redis = redis.asyncio.from_url(uri, decode_responses=True)
+        self.seen_key = f"webshop_scraper:{name}:seen"
+        self.queue_key = f"webshop_scraper:{name}:queue"
+        self.leased_key = f"webshop_scraper:{name}:leased"
+        self.done_key = f"webshop_scraper:{name}:done"
+        self.add_script = self.redis.register_script(ADD_SCRIPT)
+        self.lease_script = self.redis.register_script(LEASE_SCRIPT)
+        self.requeue_script = self.redis.register_script(REQUEUE_SCRIPT)
+
+    async def add(self, urls):
+        """ Enqueue the URLs which have never been seen before, returns the quantity of new ones """
+        urls = list(urls)
+        if not urls:
+            return 0
+        return await self.add_script(keys=[self.seen_key, self.queue_key], args=urls)
+
+    async def lease(self, count, lease_seconds):
+        """ Take up to count URLs, they are handed out again if not completed within lease_seconds """
+        return await self.lease_script(keys=[self.queue_key, self.leased_key], args=[count, time.time() + lease_seconds])
+
+    async def complete(self, url):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.zrem(self.leased_key, url)
+            pipe.incr(self.done_key)
+            await pipe.execute()
+
+    async def requeue_expired(self):
+        """ Hand out the URLs of crashed workers again, returns the quantity of requeued ones """
+        return await self.requeue_script(keys=[self.leased_key, self.queue_key], args=[time.time()])
+
+    async def counts(self):
+        """ Return (queued, leased, done) """
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.llen(self.queue_key)
+            pipe.zcard(self.leased_key)
+            pipe.get(self.done_key)
+            queued, leased, done = await pipe.execute()
+        return queued, leased, int(done or 0)
+
+    async def reset(self):
+        """ Forget the seen, queued, leased and done URLs of the last job, so the next one starts from scratch """
+        await self.redis.delete(self.seen_key, self.queue_key, self.leased_key, self.done_key)
+
+    async def close(self):
+        await self.redis.aclose()
+
+
+class SqliteFrontier:
+    """ Local stand-in for the Redis frontier, shared by worker processes on the same machine through a SQLite file """
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        # state 0 = queued, 1 = leased, 2 = done, the rowid keeps the URLs in FIFO order
+        self.db.execute("CREATE TABLE IF NOT EXISTS frontier (id INTEGER PRIMARY KEY, url TEXT UNIQUE NOT NULL, state INTEGER NOT NULL, lease_until REAL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS frontier_state ON frontier (state, id)")
+
+    async def add(self, urls):
+        self.db.execute("BEGIN IMMEDIATE")
+        before = self.db.total_changes
+        self.db.executemany("INSERT OR IGNORE INTO frontier (url, state) VALUES (?, 0)", ((url,) for url in urls))
+        self.db.execute("COMMIT")
+        return self.db.total_changes - before
+
+    async def lease(self, count, lease_seconds):
+        self.db.execute("BEGIN IMMEDIATE")
+        urls = [url for (url,) in self.db.execute("SELECT url FROM frontier WHERE state = 0 ORDER BY id LIMIT ?", (count,))]
+        self.db.executemany("UPDATE frontier SET state = 1, lease_until = ? WHERE url = ?", ((time.time() + lease_seconds, url) for url in urls))
+        self.db.execute("COMMIT")
+        return urls
+
+    async def complete(self, url):
+        self.db.execute("UPDATE frontier SET state = 2, lease_until = NULL WHERE url = ?", (url,))
+
+    async def requeue_expired(self):
+        return self.db.execute("UPDATE frontier SET state = 0 WHERE state = 1 AND lease_until < ?", (time.time(),)).rowcount
+
+    async def counts(self):
+        counts = dict(self.db.execute("SELECT state, COUNT(*) FROM frontier GROUP BY state").fetchall())
+        return counts.get(0, 0), counts.get(1, 0), counts.get(2, 0)
+
+    async def reset(self):
+        self.db.execute("DELETE FROM frontier")
+
+    async def close(self):
+        self.db.close()
+
+
+def create_frontier_backend(uri, name):
+    """ "redis://host:6379/0" for a Redis compatible store, "sqlite:///path/frontier.sqlite3" (or a plain path) for the local stand-in """
+    if urlparse(uri).scheme in ("redis", "rediss", "unix"):
+        return RedisFrontier(uri, name)
+    return SqliteFrontier(uri[len("sqlite:///"):] if uri.startswith("sqlite:///") else uri)
+
+
+async def reset_frontier(uri, start_url):
+    """ Clear the shared frontier of a shop before a new job, while no worker is running """
+    backend = create_frontier_backend(uri, urlparse(start_url).netloc)
+    try:
+        await backend.reset()
+    finally:
+        await backend.close()
+
+
+def worker_id():
+    """ Unique name of this worker process, used to name its output shard """
+    return f"{os.uname().nodename if hasattr(os, 'uname') else os.environ.get('COMPUTERNAME', 'host')}-{os.getpid()}"
+
+
+def shard_path(output_path):
+    """ The output path of this worker's shard, output_path.shard-<worker> """
+    return f"{output_path}.shard-{worker_id()}"
+
+
+def merge_shards(output_dir, output_name):
+    """ Merge the output shards of all workers (output_name.shard-<worker>.<ext>) into output_name.<ext>, dropping duplicate product URLs """
+    merged = []
+    for extension, merge in (("csv", merge_csv), ("jsonl.gz", merge_jsonl), ("sqlite3", merge_sqlite), ("parquet", merge_parquet)):
+        # Only the export files of the workers, not the other files next to the output (e.g. output_name.delta.sqlite3)
+        shards = sorted(glob.glob(os.path.join(glob.escape(output_dir), f"{glob.escape(output_name)}.shard-*.{extension}")))
+        shards = [shard for shard in shards if not shard.endswith((f".delta.{extension}", f".changes.{extension}", f".patterns.{extension}"))]
+        if shards:
+            merge(shards, os.path.join(output_dir, f"{output_name}.{extension}"))
+            merged.append(f"{len(shards)} {extension} shards")
+    return merged
+
+
+def merge_csv(shards, target):
+    seen = set()
+    with open(target, 'w', newline='', encoding='utf-8') as file:
+        writer = None
+        for shard in shards:
+            with open(shard, newline='', encoding='utf-8') as shard_file:
+                reader = csv.DictReader(shard_file)
+                if writer is None:
+                    writer = csv.DictWriter(file, fieldnames=reader.fieldnames)
+                    writer.writeheader()
+                for row in reader:
+                    if row.get("url") not in seen:
+                        seen.add(row.get("url"))
+                        writer.writerow(row)
+
+
+def merge_jsonl(shards, target):
+    seen = set()
+    with gzip.open(target, 'wt', encoding='utf-8') as file:
+        for shard in shards:
+            with gzip.open(shard, 'rt', encoding='utf-8') as shard_file:
+                for line in shard_file:
+                    url = json.loads(line).get("url")
+                    if url not in seen:
+                        seen.add(url)
+                        file.write(line)
+
+
+def merge_sqlite(shards, target):
+    if os.path.exists(target):
+        os.remove(target)
+    shutil.copyfile(shards[0], target)
+    db = sqlite3.connect(target)
+    for shard in shards[1:]:
+        db.execute("ATTACH DATABASE ? AS shard", (shard,))
+        # Upsert on SKU like the SqliteSink itself
+        db.execute("""
+            INSERT INTO products SELECT * FROM shard.products WHERE true
+            ON CONFLICT (sku) DO UPDATE SET name = excluded.name, image = excluded.image, desc = excluded.desc, price = excluded.price, url = excluded.url
+        """)
+        db.commit()
+        db.execute("DETACH DATABASE shard")
+    db.close()
+
+
+def merge_parquet(shards, target):
+    import pyarrow
+    import pyarrow.parquet
+    table = pyarrow.concat_tables([pyarrow.parquet.read_table(shard) for shard in shards])
+    pyarrow.parquet.write_table(table, target)
+
@@ -0,0 +1,209 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import asyncio
+import csv
+import gzip
+import json
+import logging
+import os
+import sqlite3
+import time
+
+FIELDNAMES = ['name', 'image', 'desc', 'sku', 'price', 'url']
+
+# placeholder of extraction_plan.py for a SKU not found on the page, it doesn't tell products apart
+MISSING_SKU = "No sku found."
+
+
+def product_sku(row):
+    """ The SKU of a product row, empty if it has none """
+    sku = str(row.get("sku") or "").strip()
+    return "" if sku == MISSING_SKU else sku
+
+
+class CsvSink:
+    """ Writes the products into a CSV file """
+    extension = "csv"
+
+    def __init__(self, path, append):
+        write_header = not append or not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, mode='a' if append else 'w', newline='', encoding='utf-8')
+        self.writer = csv.DictWriter(self.file, fieldnames=FIELDNAMES)
+        if write_header:
+            self.writer.writeheader()
+
+    def write_batch(self, rows):
+        self.writer.writerows(rows)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class JsonlSink:
+    """ Writes the products as gzip compressed JSON lines, every flush appends a new gzip member """
+    extension = "jsonl.gz"
+
+    def __init__(self, path, append):
+        self.file = gzip.open(path, mode='at' if append else 'wt', encoding='utf-8')
+
+    def write_batch(self, rows):
+        self.file.write("".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows))
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetSink:
+    """ Writes the products into a Parquet file (requires pyarrow), every batch becomes a row group """
+    extension = "parquet"
+
+    def __init__(self, path, append):
+        import pyarrow
+        import pyarrow.parquet
+        self.pyarrow = pyarrow
+        self.schema = pyarrow.schema([(field, pyarrow.string()) for field in FIELDNAMES])
+
+        # Parquet files can't be appended to, so a resumed job writes a new part next to the first one
+        if append and os.path.exists(path):
+            path = path.replace(".parquet", f".{datetime.now().strftime('%Y%m%d%H%M%S')}.parquet")
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+
+    def write_batch(self, rows):
+        columns = {field: [None if row.get(field) is None else str(row.get(field)) for row in rows] for field in FIELDNAMES}
+        self.writer.write_table(self.pyarrow.table(columns, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+class SqliteSink:
+    """ Writes the products into a SQLite table, a product with an already known SKU gets updated (upsert) """
+    extension = "sqlite3"
+
+    def __init__(self, path, append):
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        if not append:
+            self.db.execute("DROP TABLE IF EXISTS products")
+        self.db.execute("CREATE TABLE IF NOT EXISTS products (name TEXT, image TEXT, desc TEXT, sku TEXT UNIQUE, price TEXT, url TEXT)")
+        self.db.commit()
+
+    def write_batch(self, rows):
+        # Products without SKU can't be upserted, NULL never conflicts with the UNIQUE constraint
+        with self.db:
+            self.db.executemany("""
+                INSERT INTO products (name, image, desc, sku, price, url) VALUES (:name, :image, :desc, :sku, :price, :url)
+                ON CONFLICT (sku) DO UPDATE SET name = excluded.name, image = excluded.image, desc = excluded.desc, price = excluded.price, url = excluded.url
+            """, [{field: (product_sku(row) or None) if field == "sku" else row.get(field) for field in FIELDNAMES} for row in rows])
+
+    def close(self):
+        self.db.close()
+
+
+SINKS = {"csv": CsvSink, "jsonl": JsonlSink, "parquet": ParquetSink, "sqlite": SqliteSink}
+
+
+class ExportPipeline:
+    """ Queue between the crawl and the sinks, which batches the products and writes them in a background thread """
+
+    def __init__(self, output_path, formats, append, batch_size, flush_interval, dedup_sku, log_queue, metrics=None):
+        self.queue = asyncio.Queue()
+        self.metrics = metrics
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dedup_sku = dedup_sku
+        self.exported_skus = set()
+        self.log_queue = log_queue
+        self.sinks = []
+
+        # output_path is given without extension, every sink adds its own
+        for export_format in formats:
+            sink_class = SINKS.get(export_format)
+            if not sink_class:
+                log_queue.put(f"Unknown export format: {export_format}")
+                continue
+            try:
+                self.sinks.append(sink_class(f"{output_path}.{sink_class.extension}", append))
+            except ImportError as e:
+                logging.error(f"Export format {export_format} not available: {e}")
+                log_queue.put(f"Export format {export_format} not available: {e}")
+
+        # A single thread keeps the batches in order and the file I/O off the event loop,
+        # its messages are handed back to the event loop, which the log pipeline runs on
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.loop = asyncio.get_running_loop()
+        self.consumer = asyncio.create_task(self.consume())
+
+    def put(self, row):
+        """ Hand over a product, never blocks the crawl, returns False if it is skipped as a duplicate """
+        if self.is_duplicate(row):
+            return False
+        self.queue.put_nowait(row)
+        return True
+
+    async def flush(self):
+        """ Wait until all products handed over so far are written """
+        flushed = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait(flushed)
+        await flushed
+
+    async def consume(self):
+        loop = asyncio.get_running_loop()
+        batch = []
+        last_flush = loop.time()
+        while True:
+            timeout = max(0, self.flush_interval - (loop.time() - last_flush))
+            flushed = None
+            try:
+                row = await asyncio.wait_for(self.queue.get(), timeout)
+                if row is None:
+                    break
+                # a future handed in by flush() is resolved once the batch before it is written
+                if isinstance(row, asyncio.Future):
+                    flushed = row
+                else:
+                    batch.append(row)
+            except asyncio.TimeoutError:
+                pass
+
+            if flushed or len(batch) >= self.batch_size or loop.time() - last_flush >= self.flush_interval:
+                if batch:
+                    await loop.run_in_executor(self.executor, self.write_batch, batch)
+                    batch = []
+                last_flush = loop.time()
+            if flushed and not flushed.done():
+                flushed.set_result(None)
+
+        if batch:
+            await loop.run_in_executor(self.executor, self.write_batch, batch)
+
+    def is_duplicate(self, row):
+        sku = product_sku(row)
+        if not self.dedup_sku or not sku:
+            return False
+        if sku in self.exported_skus:
+            return True
+        self.exported_skus.add(sku)
+        return False
+
+    def write_batch(self, rows):
+        started = time.perf_counter()
+        for sink in self.sinks:
+            try:
+                sink.write_batch(rows)
+            except Exception as e:
+                logging.error(f"Error while exporting to {sink.extension}: {e}")
+                self.loop.call_soon_threadsafe(self.log_queue.put, f"Error while exporting to {sink.extension}: {e}")
+        if self.metrics:
+            # One observation per batch, the export runs in its own thread and doesn't hold up the pages
+            self.metrics.observe("export", time.perf_counter() - started)
+            self.metrics.inc("exported_rows_total", len(rows))
+
+    async def close(self):
+        """ Write the remaining products and close all sinks """
+        self.queue.put_nowait(None)
+        await self.consumer
+        for sink in self.sinks:
+            sink.close()
+        self.executor.shutdown()
@@ -0,0 +1,146 @@
+import re
+import lxml.etree
+import lxml.html
+
+# Several selectors of a field are separated by "||", the first one that matches wins
+FALLBACK_SEPARATOR = "||"
+
+# Bare words are class names, like the product element settings have always been, e.g. "price price--large"
+CLASS_NAME_PATTERN = re.compile(r"^[\w-]+(\s+[\w-]+)*$")
+
+# (field, itemprop) of every product field, in the order of the export
+FIELDS = [("name", "name"), ("image", "image"), ("desc", "description"), ("sku", "sku"), ("price", "price")]
+
+# Default selectors if no product element is given: the itemprops of the schema.org microdata
+DEFAULT_XPATHS = {
+    "price": "//*[@itemprop='offers']//*[@itemprop='price']",
+}
+
+PRICE_PATTERN = re.compile(r"\d[\d.,\s ']*")
+
+
+def normalize_price(text):
+    """ Normalize a price text like "€ 1.299,00", "1,299.00 EUR" or "29.9" to the exported format "1299,00" """
+    match = PRICE_PATTERN.search(text or "")
+    if not match:
+        return (text or "").strip()
+    number = re.sub(r"[\s ']", "", match.group()).rstrip(".,")
+
+    # The last separator is the decimal one if it is followed by one or two digits, all others group thousands
+    last_separator = max(number.rfind("."), number.rfind(","))
+    if last_separator != -1 and len(number) - last_separator - 1 in (1, 2):
+        integer, decimals = number[:last_separator], number[last_separator + 1:]
+        return re.sub(r"[.,]", "", integer) + "," + decimals
+    return re.sub(r"[.,]", "", number)
+
+
+def class_names(selector):
+    """ The class names of a setting made of bare words, None if it is XPath or CSS """
+    return selector.split() if CLASS_NAME_PATTERN.match(selector) else None
+
+
+def class_xpath(names):
+    """ XPath of the elements which have all of the classes """
+    return "//*[" + " and ".join(f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')" for name in names) + "]"
+
+
+def selector_xpath(selector):
+    """ Translate a product element setting into XPath: XPath is taken as it is, bare words are class names, anything else CSS """
+    if selector.startswith(("/", "(", "./")):
+        return selector
+    names = class_names(selector)
+    if names:
+        return class_xpath(names)
+    # CSS needs the optional cssselect package
+    from cssselect import GenericTranslator
+    return GenericTranslator().css_to_xpath(selector, prefix="descendant-or-self::")
+
+
+class ExtractionPlan:
+    """ The product element settings compiled once into XPath expressions, evaluated on the lxml tree of every product page """
+
+    def __init__(self, prod_els):
+        self.errors = []
+        # field -> (itemprop, custom, [(selector, compiled XPath), ...])
+        self.fields = {}
+        for field, itemprop in FIELDS:
+            setting = (prod_els or {}).get(field) or ""
+            selectors = [selector.strip() for selector in setting.split(FALLBACK_SEPARATOR) if selector.strip()]
+            custom = bool(selectors)
+            if not custom:
+                selectors = [self.default_selector(field, itemprop)]
+
+            compiled = []
+            for selector in selectors:
+                try:
+                    compiled.append((selector, self.compile(selector)))
+                except ImportError:
+                    self.errors.append(f"CSS selector '{selector}' of {field} needs the cssselect package, use XPath or a class name instead.")
+                except Exception as e:
+                    self.errors.append(f"Invalid selector '{selector}' of {field}: {e}")
+            self.fields[field] = (itemprop, custom, compiled)
+
+    def default_selector(self, field, itemprop):
+        return DEFAULT_XPATHS.get(field, f"//*[@itemprop='{itemprop}']")
+
+    def compile(self, selector):
+        """ Compile a selector into a function returning its first match in a document, or None """
+        xpath = lxml.etree.XPath(f"({selector_xpath(selector)})[1]")
+        return lambda document: next(iter(xpath(document)), None)
+
+    def extract(self, url, document, log_queue):
+        """ Return the product fields of a page, document is its parsed tree (lxml.html here) """
+        product_info = {}
+        for field, (itemprop, custom, compiled) in self.fields.items():
+            product_info[field] = self.extract_field(document, field, itemprop, custom, compiled, log_queue)
+        product_info['url'] = url
+        return product_info if any(product_info.values()) else None
+
+    def extract_field(self, document, field, itemprop, custom, compiled, log_queue):
+        for selector, find in compiled:
+            result = find(document)
+            if result is not None:
+                return self.value(result, field, custom)
+
+        log_queue.put(f"{itemprop} not found using {' || '.join(selector for selector, _ in compiled) or 'no valid selector'}.")
+        return f"No {itemprop} found."
+
+    def value(self, element, field, custom):
+        # XPath can point straight to an attribute or a text
+        if isinstance(element, str):
+            value = str(element).strip()
+        elif field == "image":
+            value = self.image_source(element)
+        elif element.tag == "meta":
+            value = element.get("content", "")
+        elif field == "desc" and custom:
+            # a description element keeps its formatting
+            value = lxml.html.tostring(element, encoding="unicode", with_tail=False)
+        else:
+            value = " ".join(element.text_content().split())
+
+        return normalize_price(value) if field == "price" else value
+
+    def image_source(self, element):
+        if element.tag != "img":
+            if element.get("content"):
+                return element.get("content")
+            element = next(element.iter("img"), None)
+            if element is None:
+                return "No image found in parent element!"
+        return element.get("src") or element.get("data-src") or "Image without src."
+
+
+# Extraction plans of the current parse worker by plan class and product element settings, only compiled once
+_extraction_plans = {}
+MAX_CACHED_PLANS = 16
+
+
+def get_extraction_plan(prod_els, plan_class=ExtractionPlan):
+    key = (plan_class, tuple(sorted((prod_els or {}).items())))
+    plan = _extraction_plans.get(key)
+    if plan is None:
+        if len(_extraction_plans) >= MAX_CACHED_PLANS:
+            _extraction_plans.clear()
+        plan = _extraction_plans[key] = plan_class(prod_els)
+    return plan
@@ -0,0 +1,76 @@
+import asyncio
+import itertools
+import re
+import time
+
+# listing and pagination pages, which usually link to many product pages
+LISTING_PATTERN = re.compile(
+    r"[?&](?:p|page|pg|seite|offset|start)=\d+|/(?:page|seite)/\d+|/(?:category|categories|kategorie|collections?|catalog|shop|products|produkte|c)(?:/|$)",
+    re.IGNORECASE,
+)
+
+PRODUCT_SCORE = 1000
+LISTING_SCORE = 20
+YIELD_WEIGHT = 50
+DEPTH_WEIGHT = 1
+# low-yield branches go behind all other URLs
+LOW_YIELD_PENALTY = 10000
+
+
+class PriorityFrontier:
+    """ Frontier that hands out the most promising URLs first: product pages, then listing pages and paths with a high product yield
+
+    The yield of the path templates is learned during the crawl by the UrlPatternLearner (url_learner.py).
+    With order "fifo" every URL has the same score, so the crawl stays breadth-first. Without products_first
+    (listing extraction) the listing pages go first, most product pages never need to be fetched then.
+    """
+
+    def __init__(self, product_identifier, order="priority", maxsize=0, metrics=None, products_first=True, learner=None):
+        self.queue = asyncio.PriorityQueue(maxsize)
+        self.metrics = metrics
+        self.product_identifier = product_identifier
+        self.prioritize = order == "priority"
+        self.products_first = products_first
+        # tie-breaker, keeps URLs of the same score in FIFO order
+        self.sequence = itertools.count()
+        self.learner = learner
+
+    def score(self, url, depth):
+        if not self.prioritize:
+            return 0
+        if self.product_identifier and self.product_identifier in url:
+            return (PRODUCT_SCORE if self.products_first else 0) - depth * DEPTH_WEIGHT
+
+        score = LISTING_SCORE if LISTING_PATTERN.search(url) else 0
+        if self.learner:
+            score += YIELD_WEIGHT * self.learner.yield_rate(url, depth)
+            if self.learner.deprioritize(url, depth):
+                score -= LOW_YIELD_PENALTY
+        return score - depth * DEPTH_WEIGHT
+
+    def record_yield(self, url, depth, new_links):
+        """ Learn the product yield of a visited page from the new links found on it """
+        if self.learner:
+            self.learner.record(url, depth, new_links)
+
+    def put_nowait(self, url, depth=0):
+        self.queue.put_nowait((-self.score(url, depth), next(self.sequence), url, depth, time.perf_counter()))
+
+    async def put(self, url, depth=0):
+        await self.queue.put((-self.score(url, depth), next(self.sequence), url, depth, time.perf_counter()))
+
+    async def get(self):
+        """ Return (url, depth) of the most promising URL """
+        _, _, url, depth, enqueued = await self.queue.get()
+        if self.metrics:
+            self.metrics.observe("queue_wait", time.perf_counter() - enqueued)
+        return url, depth
+
+    def task_done(self):
+        self.queue.task_done()
+
+    async def join(self):
+        await self.queue.join()
+
+    def qsize(self):
+        return self.queue.qsize()
@@ -59,12 +59,16 @@ class AdvSettingsGUI:
         all_settings = {
             "settings": {
                 "url": self.app_instance.url_entry.get(),
+                "mode": "html" if self.app_instance.mode_html.get() else "json",
                 "product_identifier": self.app_instance.product_identifier_entry.get(),
                 "prod_name": self.app_instance.prod_name_el.get(),
                 "prod_sku": self.app_instance.prod_sku_el.get(),
                 "prod_price": self.app_instance.prod_price_el.get(),
                 "prod_desc": self.app_instance.prod_desc_el.get(),
                 "prod_image": self.app_instance.prod_image_el.get(),
+                "discovery": "sitemap" if self.app_instance.discovery_sitemap.get() else "crawl",
+                "sitemap_since": self.app_instance.sitemap_since_entry.get(),
+                "listing": self.app_instance.listing.get(),
             },
             "adv_settings": {
                 "blacklist": self.blacklist_text.get("1.0", tk.END).strip(), 
@@ -90,6 +94,11 @@ class AdvSettingsGUI:
             self.app_instance.url_entry.delete(0, tk.END)
             self.app_instance.url_entry.insert(0, settings.get("url", ""))
 
+            if settings.get("mode") == "json":
+                self.app_instance.set_json_mode()
+            else:
+                self.app_instance.set_html_mode()
+
             self.app_instance.product_identifier_entry.delete(0, tk.END)
             self.app_instance.product_identifier_entry.insert(0, settings.get("product_identifier", ""))
 
@@ -108,6 +117,11 @@ class AdvSettingsGUI:
             self.app_instance.prod_image_el.delete(0, tk.END)
             self.app_instance.prod_image_el.insert(0, settings.get("prod_image", ""))
 
+            self.app_instance.discovery_sitemap.set(settings.get("discovery") == "sitemap")
+            self.app_instance.sitemap_since_entry.delete(0, tk.END)
+            self.app_instance.sitemap_since_entry.insert(0, settings.get("sitemap_since", ""))
+            self.app_instance.listing.set(bool(settings.get("listing", False)))
+
             # handle the advanced setting
             adv_settings = loaded_data.get("adv_settings", {})
 
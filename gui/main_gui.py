@@ -2,6 +2,7 @@ import tkinter as tk
 from tkinter import scrolledtext, messagebox
 import queue
 from scraper import Scraper
+from constants import LOG_MAX_LINES, LOG_QUEUE_SIZE
 from gui.adv_settings import AdvSettingsGUI
 import threading
 import logging
@@ -52,6 +53,26 @@ class ScraperApp:
         self.adv_setting_btn = tk.Button(root, text="Advanced Settings", command=self.show_adv_settings)
         self.adv_setting_btn.grid(row=2, column=2, padx=0, pady=10)
 
+        # Discovery selection (crawl all links or read the sitemaps)
+        self.discovery_sitemap = tk.BooleanVar(value=False)
+        self.sitemap_button = tk.Checkbutton(root, text="Sitemap Discovery", variable=self.discovery_sitemap)
+        self.sitemap_button.grid(row=3, column=0, padx=0, pady=10)
+
+        self.sitemap_since_label = tk.Label(root, text="Modified since (YYYY-MM-DD):")
+        self.sitemap_since_label.grid(row=3, column=1, padx=0, pady=10, sticky="e")
+        self.sitemap_since_entry = tk.Entry(root, width=12)
+        self.sitemap_since_entry.grid(row=3, column=2, padx=0, pady=10, sticky="w")
+
+        # Listing extraction (products straight from the category pages)
+        self.listing = tk.BooleanVar(value=False)
+        self.listing_button = tk.Checkbutton(root, text="Extract from listing pages", variable=self.listing)
+        self.listing_button.grid(row=5, column=0, padx=0, pady=10)
+
+        # Record the fetched pages, so the products can be re-extracted offline with "Replay recording"
+        self.archive = tk.BooleanVar(value=False)
+        self.archive_button = tk.Checkbutton(root, text="Record pages", variable=self.archive)
+        self.archive_button.grid(row=5, column=1, padx=0, pady=10)
+
         # Product Field Container Frame
         self.product_frame = tk.Frame(root)
 
@@ -91,6 +112,15 @@ class ScraperApp:
         self.start_button.grid(row=0, column=0, padx=10)
         self.stop_button = tk.Button(self.button_frame, text="Stop Scraping", command=self.stop_scraping, state=tk.DISABLED)
         self.stop_button.grid(row=0, column=1, padx=10)
+        self.resume = tk.BooleanVar(value=False)
+        self.resume_button = tk.Checkbutton(self.button_frame, text="Resume previous crawl", variable=self.resume)
+        self.resume_button.grid(row=0, column=2, padx=10)
+        self.delta = tk.BooleanVar(value=False)
+        self.delta_button = tk.Checkbutton(self.button_frame, text="Only changed products", variable=self.delta)
+        self.delta_button.grid(row=0, column=3, padx=10)
+        self.replay = tk.BooleanVar(value=False)
+        self.replay_button = tk.Checkbutton(self.button_frame, text="Replay recording", variable=self.replay)
+        self.replay_button.grid(row=0, column=4, padx=10)
 
         # Output window (for terminal output redirection)
         self.log_output = scrolledtext.ScrolledText(root, width=70, height=10, state=tk.DISABLED)
@@ -99,8 +129,8 @@ class ScraperApp:
         self.scraping_thread = None
         self.stop_flag = threading.Event()
 
-        # Initialize a queue for thread-safe logging
-        self.log_queue = queue.Queue()
+        # Initialize a queue for thread-safe logging, bounded so a flood of messages is dropped instead of piling up
+        self.log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
         self.log_buffer = []
         self.process_log_queue()
 
@@ -143,6 +173,13 @@ class ScraperApp:
             "mode": mode, 
             "product_identifier": product_identifier, 
             "prod_els": prod_els, 
+            "discovery": "sitemap" if self.discovery_sitemap.get() else "crawl",
+            "sitemap_since": self.sitemap_since_entry.get().strip() or None,
+            "resume": self.resume.get(),
+            "delta": self.delta.get(),
+            "listing": self.listing.get(),
+            "archive": self.archive.get(),
+            "replay": self.replay.get(),
             "log_queue": self.log_queue
         }
 
@@ -179,15 +216,19 @@ class ScraperApp:
         self.stop_button.config(state=tk.DISABLED)
         self.start_button.config(state=tk.NORMAL)
 
-        self.log_queue.put("Scraping stopped.")
+        try:
+            self.log_queue.put_nowait("Scraping stopped.")
+        except queue.Full:
+            # this thread empties the queue, so it must never wait for it
+            self.log_buffer.append("Scraping stopped.\n")
 
         # Ensure thread and event loop are properly stopped
         if self.scraping_thread:
             self.scraping_thread.join()  # Wait for the thread to finish
         
     def process_log_queue(self):
-        # Process messages from the queue and add them to the buffer
-        while not self.log_queue.empty():
+        # Process messages from the queue and add them to the buffer, at most LOG_MAX_LINES per run, so the UI never freezes
+        while not self.log_queue.empty() and len(self.log_buffer) < LOG_MAX_LINES:
             log_message = self.log_queue.get_nowait()
             self.log_buffer.append(log_message + "\n")
 
@@ -196,10 +237,20 @@ class ScraperApp:
                 self.start_button.config(state=tk.NORMAL)
                 self.stop_button.config(state=tk.DISABLED)
 
+        # The message of the finished job may have been dropped from the full queue, the ended thread tells as well
+        if self.scraping_thread and not self.scraping_thread.is_alive() and self.log_queue.empty():
+            self.start_button.config(state=tk.NORMAL)
+            self.stop_button.config(state=tk.DISABLED)
+
         # Now display the buffered messages in the output window
         if self.log_buffer:
             self.log_output.config(state=tk.NORMAL)
             self.log_output.insert(tk.END, ''.join(self.log_buffer))
+
+            # Only keep the last LOG_MAX_LINES lines in the output window, the full log is in the log file
+            excess_lines = int(self.log_output.index("end-1c").split(".")[0]) - LOG_MAX_LINES
+            if excess_lines > 0:
+                self.log_output.delete("1.0", f"{excess_lines + 1}.0")
             self.log_output.yview(tk.END)
             self.log_output.config(state=tk.DISABLED)
             self.log_buffer = []
@@ -0,0 +1,147 @@
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, urlunparse
+import asyncio
+import logging
+import sqlite3
+import zlib
+import time
+import os
+
+# commit every COMMIT_EVERY writes, so an interrupted crawl doesn't lose its cache, and enforce the limits every EVICT_EVERY writes
+COMMIT_EVERY = 100
+EVICT_EVERY = 1000
+
+
+class HttpCache:
+    """ Persistent on-disk cache of response bodies and their validators (ETag / Last-Modified)
+
+    The SQLite queries and the zlib work run in a background thread, so the cache never blocks the event loop.
+    The max size and age are enforced when the cache is opened, every EVICT_EVERY writes and when it is closed.
+    """
+
+    def __init__(self, cache_dir, max_size_mb, max_age_days, max_pending):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.max_size = max_size_mb * 1024 * 1024
+        self.max_age = max_age_days * 24 * 60 * 60
+        self.hits = 0
+        self.misses = 0
+        self.pending_writes = 0
+        self.writes_since_evict = 0
+        # The writes finished in the thread hand their slot back on the event loop
+        self.loop = asyncio.get_running_loop()
+        self.pending = asyncio.Semaphore(max_pending)
+
+        # One SQLite file holds the zlib compressed bodies together with the validators
+        self.db = sqlite3.connect(os.path.join(cache_dir, "http_cache.sqlite3"), check_same_thread=False)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                stored_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self.db.commit()
+
+        # A single thread keeps the database in one thread and the reads behind the writes before them
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.executor.submit(self.evict)
+
+    def normalize_url(self, url):
+        """ The cache key of a URL: lowercase scheme and host, without fragment """
+        parsed = urlparse(url)
+        return urlunparse(parsed._replace(scheme=parsed.scheme.lower(), netloc=parsed.netloc.lower(), fragment=""))
+
+    async def run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    async def conditional_headers(self, url, headers):
+        """ Return the headers extended by If-None-Match / If-Modified-Since if the URL is cached """
+        row = await self.run(self.read_validators, self.normalize_url(url))
+        if not row:
+            return headers
+
+        headers = dict(headers)
+        etag, last_modified = row
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        return headers
+
+    async def get(self, url):
+        """ Return the cached body of a URL (after a 304 Not Modified) and mark it as recently used """
+        body = await self.run(self.read_body, self.normalize_url(url))
+        if body is not None:
+            self.hits += 1
+        return body
+
+    async def store(self, url, response_headers, body):
+        """ Store a body, as long as the response carries a validator to revalidate it with, only waits while max_pending bodies are still waiting to be written """
+        self.misses += 1
+        etag = response_headers.get("ETag")
+        last_modified = response_headers.get("Last-Modified")
+        if not etag and not last_modified:
+            return
+        await self.pending.acquire()
+        future = self.executor.submit(self.write_body, self.normalize_url(url), etag, last_modified, body)
+        future.add_done_callback(lambda _: self.loop.call_soon_threadsafe(self.pending.release))
+
+    def read_validators(self, key):
+        return self.db.execute("SELECT etag, last_modified FROM responses WHERE url = ?", (key,)).fetchone()
+
+    def read_body(self, key):
+        row = self.db.execute("SELECT body FROM responses WHERE url = ?", (key,)).fetchone()
+        if not row:
+            return None
+        self.db.execute("UPDATE responses SET stored_at = ?, last_access = ? WHERE url = ?", (time.time(), time.time(), key))
+        self.commit_periodically()
+        return zlib.decompress(row[0]).decode("utf-8")
+
+    def write_body(self, key, etag, last_modified, body):
+        try:
+            compressed = zlib.compress(body.encode("utf-8"))
+            now = time.time()
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses (url, etag, last_modified, body, size, stored_at, last_access) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, etag, last_modified, compressed, len(compressed), now, now),
+            )
+            self.commit_periodically()
+        except sqlite3.Error as e:
+            logging.error(f"Error while caching {key}: {e}")
+
+    def commit_periodically(self):
+        """ Commit every COMMIT_EVERY writes and evict every EVICT_EVERY writes, so the cache also keeps its limits during a long crawl """
+        self.pending_writes += 1
+        self.writes_since_evict += 1
+        if self.writes_since_evict >= EVICT_EVERY:
+            self.evict()
+        elif self.pending_writes >= COMMIT_EVERY:
+            self.db.commit()
+            self.pending_writes = 0
+
+    def evict(self):
+        """ Drop entries older than the max age, then the least recently used ones until the cache fits into the max size """
+        self.db.execute("DELETE FROM responses WHERE stored_at < ?", (time.time() - self.max_age,))
+
+        total_size = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total_size > self.max_size:
+            rows = self.db.execute("SELECT url, size FROM responses ORDER BY last_access").fetchall()
+            for url, size in rows:
+                if total_size <= self.max_size:
+                    break
+                self.db.execute("DELETE FROM responses WHERE url = ?", (url,))
+                total_size -= size
+        self.db.commit()
+        self.pending_writes = 0
+        self.writes_since_evict = 0
+
+    def close(self):
+        """ Wait for the pending writes, then enforce the limits and close the database """
+        self.executor.shutdown()
+        self.evict()
+        self.db.close()
@@ -0,0 +1,185 @@
+from urllib.parse import urljoin
+import re
+import lxml.etree
+from structured_data import JSON_DECODE_ERRORS, MicrodataTarget, has_type, iter_json_ld, json_loads, normalize_price, product_from_json_ld
+
+# embedded state of JavaScript shops: <script type="application/json"> (e.g. __NEXT_DATA__) and window.__INITIAL_STATE__ = {...}
+JSON_SCRIPT_PATTERN = re.compile(r'<script[^>]+type=["\']?application/json["\']?[^>]*>(.*?)</script>', re.IGNORECASE | re.DOTALL)
+STATE_ASSIGNMENT_PATTERN = re.compile(r'window\.__[A-Z_]+__\s*=\s*(\{.*?\})\s*;?\s*</script>', re.DOTALL)
+
+LIST_TYPES = ("ItemList", "OfferCatalog")
+
+# keys of the product records in embedded state, the first one present wins
+STATE_KEYS = {
+    "name": ("name", "title", "productName"),
+    "price": ("price", "salePrice", "finalPrice", "currentPrice"),
+    "url": ("url", "productUrl", "canonicalUrl", "href", "link"),
+    "sku": ("sku", "articleNumber", "mpn"),
+    "image": ("image", "imageUrl", "thumbnail", "images"),
+    "desc": ("description", "shortDescription"),
+}
+
+# embedded state can be huge, nesting deeper than this is not searched
+MAX_STATE_DEPTH = 12
+
+
+def iter_list_products(data):
+    """ Yield (product node, offer) of every item of the ItemLists and OfferCatalogs of decoded JSON-LD """
+    if isinstance(data, list):
+        for item in data:
+            yield from iter_list_products(item)
+    elif isinstance(data, dict):
+        if has_type(data, LIST_TYPES):
+            for element in as_list(data.get("itemListElement")):
+                yield from iter_list_element(element)
+        elif "@graph" in data:
+            yield from iter_list_products(data["@graph"])
+
+
+def iter_list_element(element):
+    if not isinstance(element, dict):
+        return
+    if has_type(element, ("Product",)):
+        yield element, None
+    elif has_type(element, ("ListItem",)) and isinstance(element.get("item"), dict):
+        # A ListItem with only a url is a plain link, the crawl follows those anyway
+        yield from iter_list_element(element["item"])
+    elif has_type(element, ("Offer",)) and isinstance(element.get("itemOffered"), dict):
+        yield element["itemOffered"], element
+    elif has_type(element, LIST_TYPES):
+        # OfferCatalogs nest their sub catalogs
+        for nested in as_list(element.get("itemListElement")):
+            yield from iter_list_element(nested)
+
+
+def as_list(value):
+    return value if isinstance(value, list) else [value] if value else []
+
+
+def products_from_json_ld(page_url, response_text, log_queue):
+    """ Products of the ItemLists/OfferCatalogs and all top level Products of a listing page """
+    products = []
+    for block in iter_json_ld(response_text):
+        try:
+            data = json_loads(block)
+        except JSON_DECODE_ERRORS as e:
+            log_queue.put(f"Error parsing JSON from {page_url}: {e}")
+            continue
+
+        for node, offer in iter_list_products(data):
+            product = product_from_json_ld(None, node)
+            if offer and not product["price"]:
+                product["price"] = normalize_price(offer.get("price"))
+            product["url"] = product["url"] or node.get("url") or (offer or {}).get("url")
+            products.append(product)
+        for node in as_list(data.get("@graph") if isinstance(data, dict) and "@graph" in data else data):
+            if isinstance(node, dict) and has_type(node, ("Product",)):
+                product = product_from_json_ld(None, node)
+                product["url"] = product["url"] or node.get("url")
+                products.append(product)
+    return products
+
+
+class MicrodataListTarget(MicrodataTarget):
+    """ Collects every top level microdata Product of a page, like the product tiles of a category page """
+
+    def __init__(self):
+        super().__init__()
+        self.products = []
+
+    def end(self, tag):
+        super().end(tag)
+        if self.product_done:
+            self.products.append(self.microdata)
+            self.microdata = {}
+            self.product_done = False
+
+    def close(self):
+        return self.products
+
+
+def products_from_microdata(response_text):
+    parser = lxml.etree.HTMLParser(target=MicrodataListTarget())
+    try:
+        parser.feed(response_text.encode("utf-8"))
+        tiles = parser.close()
+    except lxml.etree.LxmlError:
+        return []
+    return [{
+        'name': tile.get("name", ""),
+        'image': tile.get("image", ""),
+        'desc': tile.get("desc", ""),
+        'sku': tile.get("sku", ""),
+        'price': normalize_price(tile.get("price")),
+        'url': tile.get("url"),
+    } for tile in tiles]
+
+
+def state_value(record, field):
+    for key in STATE_KEYS[field]:
+        value = record.get(key)
+        if isinstance(value, list):
+            value = value[0] if value else None
+        if isinstance(value, dict):
+            # prices like {"amount": 29.9, "currency": "EUR"}, images like {"url": ...}
+            value = next((value[key] for key in ("amount", "value", "url", "src") if value.get(key) not in (None, "")), None)
+        if value not in (None, "") and not isinstance(value, (dict, list, bool)):
+            return value
+    return None
+
+
+def iter_state_records(data, depth=0):
+    """ Yield every object of embedded state which looks like a product: a name, a price and a URL """
+    if depth > MAX_STATE_DEPTH:
+        return
+    if isinstance(data, list):
+        for item in data:
+            yield from iter_state_records(item, depth + 1)
+    elif isinstance(data, dict):
+        if all(state_value(data, field) is not None for field in ("name", "price", "url")):
+            yield data
+            return
+        for value in data.values():
+            if isinstance(value, (dict, list)):
+                yield from iter_state_records(value, depth + 1)
+
+
+def products_from_state(response_text):
+    products = []
+    for pattern in (JSON_SCRIPT_PATTERN, STATE_ASSIGNMENT_PATTERN):
+        for blob in pattern.findall(response_text):
+            try:
+                data = json_loads(blob)
+            except JSON_DECODE_ERRORS:
+                # JavaScript objects are no JSON in general, those are skipped
+                continue
+            for record in iter_state_records(data):
+                products.append({
+                    'name': str(state_value(record, "name")),
+                    'image': str(state_value(record, "image") or ""),
+                    'desc': str(state_value(record, "desc") or ""),
+                    'sku': str(state_value(record, "sku") or ""),
+                    'price': normalize_price(state_value(record, "price")),
+                    'url': str(state_value(record, "url")),
+                })
+    return products
+
+
+def extract_listing_products(page_url, response_text, log_queue):
+    """ The product records of a category or pagination page: JSON-LD lists, microdata tiles or embedded state
+
+    The first source with products wins, records without a URL are dropped (they can't be told apart from each other),
+    the URLs are made absolute. Missing fields are empty, the caller decides whether the detail page is needed.
+    """
+    sources = (
+        lambda: products_from_json_ld(page_url, response_text, log_queue),
+        lambda: products_from_microdata(response_text) if "itemscope" in response_text else [],
+        lambda: products_from_state(response_text),
+    )
+    for source in sources:
+        products = [product for product in source() if isinstance(product.get("url"), str) and product["url"].strip()]
+        if products:
+            for product in products:
+                product["url"] = urljoin(page_url, product["url"].strip())
+            return products
+    return []
@@ -0,0 +1,89 @@
+from collections import Counter
+import logging
+import queue
+import re
+import time
+
+# URLs and numbers are masked, so the same message about different pages counts as a repetition
+URL_PATTERN = re.compile(r"\w+://\S+")
+NUMBER_PATTERN = re.compile(r"\d+")
+
+
+def message_key(message):
+    return NUMBER_PATTERN.sub("#", URL_PATTERN.sub("<url>", message))
+
+
+class LogPipeline:
+    """ Sits between the scraper and its log output (the queue of the GUI or the console of the CLI)
+
+    Repeated messages are only shown repeat_limit times and counted afterwards, the counts of the suppressed
+    ones come with the next progress snapshot. The output is never blocked: if a bounded queue is full,
+    the message is dropped and counted. Runs on the event loop of the scraper only.
+    """
+
+    def __init__(self, sink, repeat_limit):
+        self.sink = sink
+        self.repeat_limit = repeat_limit
+        self.seen = Counter()
+        # key -> [suppressed since the last snapshot, last suppressed message]
+        self.suppressed = {}
+        self.counters = Counter()
+        self.started = time.monotonic()
+        self.last_snapshot = self.started
+        self.last_visited = 0
+
+    def put(self, message):
+        """ Show a message, unless it has been shown repeat_limit times already """
+        key = message_key(message)
+        self.seen[key] += 1
+        if self.seen[key] > self.repeat_limit:
+            suppressed = self.suppressed.setdefault(key, [0, message])
+            suppressed[0] += 1
+            suppressed[1] = message
+            self.counters["suppressed"] += 1
+            return False
+        self.forward(message)
+        return True
+
+    def error(self, message):
+        """ Count an error and show it in both log outputs, repetitions are sampled like in put """
+        self.counters["errors"] += 1
+        if self.put(message):
+            logging.error(message)
+
+    def count(self, name, value=1):
+        self.counters[name] += value
+
+    def forward(self, message):
+        try:
+            if isinstance(self.sink, queue.Queue):
+                self.sink.put_nowait(message)
+            else:
+                self.sink.put(message)
+        except queue.Full:
+            self.counters["dropped"] += 1
+
+    def snapshot_due(self, interval):
+        return time.monotonic() - self.last_snapshot >= interval
+
+    def snapshot(self, visited, queued_label, queued, products):
+        """ Show the aggregated progress instead of a line per page, followed by the counts of the suppressed messages """
+        now = time.monotonic()
+        rate = (visited - self.last_visited) / max(now - self.last_snapshot, 0.001)
+        self.last_snapshot = now
+        self.last_visited = visited
+
+        plural = "" if products == 1 else "s"
+        errors = f" | errors: {self.counters['errors']}" if self.counters["errors"] else ""
+        self.forward(f"Visited: {visited} ({rate:.0f}/s) | {queued_label}: {queued} | product{plural}: {products}{errors}.")
+        self.flush_suppressed()
+
+    def flush_suppressed(self):
+        for count, message in self.suppressed.values():
+            self.forward(f"{count} more like: {message}")
+        self.suppressed = {}
+
+    def close(self):
+        self.flush_suppressed()
+        if self.counters["dropped"]:
+            logging.warning(f"{self.counters['dropped']} log messages dropped, the log output was full.")
@@ -0,0 +1,187 @@
+from bisect import bisect_left
+from collections import Counter
+import asyncio
+import json
+import os
+import time
+import aiohttp
+from aiohttp import web
+
+# upper bounds of the histogram buckets [s], from sub-millisecond parse stages to slow downloads
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# the stages of a page in the order they happen, shown in this order in the summary
+STAGES = ("queue_wait", "dns", "connect", "download", "parse_wait", "parse", "extraction", "links", "export")
+
+PREFIX = "webshop_scraper"
+
+
+class Histogram:
+    """ Counts of the observed durations per bucket, with their sum, in the layout of a Prometheus histogram """
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.buckets[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile_ms(self, share):
+        """ Upper bound of the bucket holding the given share of the observations [ms], None beyond the last bucket """
+        rank = share * self.count
+        cumulative = 0
+        for bound, count in zip(BUCKETS, self.buckets):
+            cumulative += count
+            if cumulative >= rank:
+                return 1000 * bound
+        return None
+
+
+class Metrics:
+    """ Opt-in timers of the stages of every page and counters of the responses
+
+    Only plain arithmetic on the event loop, the stages of the parse executor are timed
+    in the worker and handed back with the parse results. Observed durations are in seconds.
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        # (name, sorted label items) -> value
+        self.counters = Counter()
+        self.started = time.time()
+
+    def observe(self, stage, seconds):
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = Histogram()
+        histogram.observe(seconds)
+
+    def observe_all(self, timings):
+        for stage, seconds in timings.items():
+            self.observe(stage, seconds)
+
+    def inc(self, name, value=1, **labels):
+        self.counters[(name, tuple(sorted(labels.items())))] += value
+
+    def trace_config(self):
+        """ aiohttp trace hooks for the DNS lookup, the connection setup and the response bytes of every request """
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_dns_resolvehost_start(session, context, params):
+            context.dns_started = time.perf_counter()
+
+        async def on_dns_resolvehost_end(session, context, params):
+            self.observe("dns", time.perf_counter() - context.dns_started)
+
+        async def on_connection_create_start(session, context, params):
+            context.connect_started = time.perf_counter()
+
+        async def on_connection_create_end(session, context, params):
+            self.observe("connect", time.perf_counter() - context.connect_started)
+
+        async def on_response_chunk_received(session, context, params):
+            self.inc("response_bytes_total", len(params.chunk))
+
+        trace_config.on_dns_resolvehost_start.append(on_dns_resolvehost_start)
+        trace_config.on_dns_resolvehost_end.append(on_dns_resolvehost_end)
+        trace_config.on_connection_create_start.append(on_connection_create_start)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_response_chunk_received.append(on_response_chunk_received)
+        return trace_config
+
+    def prometheus_text(self):
+        """ All metrics in the Prometheus text exposition format """
+        lines = [f"# TYPE {PREFIX}_stage_seconds histogram"]
+        for stage, histogram in self.histograms.items():
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ("+Inf",), histogram.buckets):
+                cumulative += count
+                lines.append(f'{PREFIX}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'{PREFIX}_stage_seconds_sum{{stage="{stage}"}} {histogram.sum}')
+            lines.append(f'{PREFIX}_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+
+        typed = set()
+        for (name, labels), value in sorted(self.counters.items()):
+            if name not in typed:
+                lines.append(f"# TYPE {PREFIX}_{name} counter")
+                typed.add(name)
+            label_text = "{" + ",".join(f'{key}="{label}"' for key, label in labels) + "}" if labels else ""
+            lines.append(f"{PREFIX}_{name}{label_text} {value}")
+        return "\n".join(lines) + "\n"
+
+    def as_dict(self):
+        counters = {}
+        for (name, labels), value in self.counters.items():
+            key = name + "".join(f".{label}" for _, label in labels)
+            counters[key] = value
+        return {
+            "uptime_seconds": round(time.time() - self.started, 1),
+            "stages": {
+                stage: {
+                    "count": histogram.count,
+                    "mean_ms": round(1000 * histogram.sum / histogram.count, 3),
+                    "p50_ms_upper": histogram.quantile_ms(0.5),
+                    "p95_ms_upper": histogram.quantile_ms(0.95),
+                    "total_seconds": round(histogram.sum, 3),
+                }
+                for stage, histogram in self.histograms.items() if histogram.count
+            },
+            "counters": counters,
+        }
+
+    def dump(self, path):
+        """ Write the metrics as JSON, replaced atomically so a reader never sees a partial file """
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, "w") as file:
+            json.dump(self.as_dict(), file, indent=4)
+        os.replace(temporary_path, path)
+
+    def summary(self):
+        stages = [
+            f"{stage} {1000 * self.histograms[stage].sum / self.histograms[stage].count:.1f}"
+            for stage in STAGES if stage in self.histograms and self.histograms[stage].count
+        ]
+        return f"Stage timings (mean ms): {', '.join(stages) if stages else 'none'}."
+
+
+class MetricsReporter:
+    """ Exposes the metrics on http://<host>:<port>/metrics and/or dumps them as JSON in regular intervals """
+
+    def __init__(self, metrics, port=None, dump_path=None, dump_interval=30, host="127.0.0.1"):
+        self.metrics = metrics
+        self.port = port
+        self.host = host
+        self.dump_path = dump_path
+        self.dump_interval = dump_interval
+        self.runner = None
+        self.dumper = None
+
+    async def start(self):
+        if self.port:
+            app = web.Application()
+            app.router.add_get("/metrics", self.handle_metrics)
+            self.runner = web.AppRunner(app, access_log=None)
+            await self.runner.setup()
+            await web.TCPSite(self.runner, self.host, self.port).start()
+        if self.dump_path and self.dump_interval:
+            self.dumper = asyncio.create_task(self.dump_periodically())
+
+    async def handle_metrics(self, request):
+        return web.Response(text=self.metrics.prometheus_text(), content_type="text/plain", charset="utf-8")
+
+    async def dump_periodically(self):
+        while True:
+            await asyncio.sleep(self.dump_interval)
+            self.metrics.dump(self.dump_path)
+
+    async def close(self):
+        if self.dumper:
+            self.dumper.cancel()
+            await asyncio.gather(self.dumper, return_exceptions=True)
+        if self.dump_path:
+            self.metrics.dump(self.dump_path)
+        if self.runner:
+            await self.runner.cleanup()
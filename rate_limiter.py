@@ -0,0 +1,124 @@
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+from datetime import datetime, timezone
+import asyncio
+import time
+from constants import HOST_INITIAL_RATE, HOST_MAX_RATE, HOST_INITIAL_CONCURRENCY, HOST_MAX_CONCURRENCY, SLOW_RESPONSE_THRESHOLD
+
+
+def parse_retry_after(value):
+    """ Return the seconds to wait of a Retry-After header, which is either given in seconds or as HTTP date """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class HostLimiter:
+    """ Token bucket and AIMD concurrency limit of a single host """
+
+    def __init__(self, max_concurrency=HOST_MAX_CONCURRENCY):
+        self.max_concurrency = max_concurrency
+        self.rate = HOST_INITIAL_RATE
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.concurrency = HOST_INITIAL_CONCURRENCY
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.slow_start = True
+        # smoothed latency of the responses, the round trip time a decrease is limited to once per
+        self.rtt = None
+        self.last_decrease = float("-inf")
+        self.last_increase = float("-inf")
+        self.condition = asyncio.Condition()
+
+    async def acquire(self):
+        """ Wait for a free concurrency slot, the end of any Retry-After cooldown and a token of the bucket """
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < int(self.concurrency))
+            self.in_flight += 1
+
+        try:
+            cooldown = self.blocked_until - time.monotonic()
+            if cooldown > 0:
+                await asyncio.sleep(cooldown)
+
+            # Reserve a token, if the bucket is empty wait until it has been refilled
+            now = time.monotonic()
+            self.tokens = min(max(1.0, self.rate), self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens < 0:
+                await asyncio.sleep(-self.tokens / self.rate)
+        except asyncio.CancelledError:
+            # Cancelled while waiting (stop flag, max duration, shutdown): give the slot back, the limits stay as they are
+            await self.free_slot()
+            raise
+
+    async def release(self, status, latency, retry_after=None):
+        """ Free the slot and adapt rate and concurrency to the outcome of the request
+
+        Only 429/503, timeouts, connection errors and slow responses are signs of overload, other server errors are
+        failures of a single page and leave the limits as they are. A Retry-After holds back the whole host, without one
+        only the retried request backs off (see Scraper.fetch).
+        """
+        now = time.monotonic()
+        if status is not None:
+            self.rtt = latency if self.rtt is None else 0.8 * self.rtt + 0.2 * latency
+
+        if status in (429, 503):
+            # The server asks us to slow down, by the factor of TCP CUBIC, which recovers faster than halving from isolated throttles
+            self.decrease(0.7, now)
+            cooldown = parse_retry_after(retry_after)
+            if cooldown:
+                self.blocked_until = max(self.blocked_until, now + cooldown)
+        elif status is None or latency > SLOW_RESPONSE_THRESHOLD:
+            # Timeouts, connection errors and slow responses: back off gently
+            self.decrease(0.75, now)
+        elif status >= 500:
+            pass
+        elif self.slow_start:
+            # Healthy response before the first sign of overload: double about once per window, like TCP slow start
+            self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+            self.rate = min(HOST_MAX_RATE, self.rate + 1)
+        elif now - self.last_increase >= self.rtt:
+            # Healthy responses: additive increase once per round trip, one more request in flight and the rate it allows
+            self.last_increase = now
+            self.rate = min(HOST_MAX_RATE, self.rate * (self.concurrency + 1) / self.concurrency)
+            self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+
+        await self.free_slot()
+
+    async def free_slot(self):
+        # Counted back right away, even if waiting for the lock gets cancelled the slot is not lost
+        self.in_flight -= 1
+        async with self.condition:
+            self.condition.notify_all()
+
+    def decrease(self, factor, now):
+        """ Multiplicative decrease, at most once per round trip, the other responses of the same window carry no news """
+        if now - self.last_decrease < (self.rtt or 0):
+            return
+        self.last_decrease = now
+        self.slow_start = False
+        self.concurrency = max(1.0, self.concurrency * factor)
+        self.rate = max(0.5, self.rate * factor)
+
+
+class RateLimiter:
+    """ Keeps one HostLimiter per host, their concurrency grows up to max_concurrency (the concurrency of the job) """
+
+    def __init__(self, max_concurrency=HOST_MAX_CONCURRENCY):
+        self.max_concurrency = max_concurrency
+        self.hosts = {}
+
+    def for_url(self, url):
+        host = urlparse(url).netloc.lower()
+        if host not in self.hosts:
+            self.hosts[host] = HostLimiter(self.max_concurrency)
+        return self.hosts[host]
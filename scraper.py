@@ -1,17 +1,37 @@
-from bs4 import BeautifulSoup
-from urllib.parse import urlparse, urljoin, urlunparse
+from urllib.parse import urlparse, urljoin
 import threading
-import json
+import re
 import os
-import csv
 import logging
 import asyncio
 import aiohttp
-from constants import GENERAL_BLACKLIST, SIMULTANEOUS_SCRAPS, RESPONSE_TIMEOUT, RESPONSE_RETRY, SPEED_TEST_MODE, SPEED_TEST_DURATION, EXCLUDED_EXTENSIONS
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from constants import GENERAL_BLACKLIST, SIMULTANEOUS_SCRAPS, HOST_MAX_CONCURRENCY, RESPONSE_RETRY, SPEED_TEST_MODE, SPEED_TEST_DURATION, EXCLUDED_EXTENSIONS, PARSE_EXECUTOR, PARSE_WORKERS, HTTP_CACHE, HTTP_CACHE_DIR, HTTP_CACHE_MAX_SIZE, HTTP_CACHE_MAX_AGE, HTTP_CACHE_MAX_PENDING, CHECKPOINT_INTERVAL, SEEN_STORE, BLOOM_FALSE_POSITIVE_RATE, EXPORT_DIR, EXPORT_FORMATS, EXPORT_BATCH_SIZE, EXPORT_FLUSH_INTERVAL, EXPORT_DEDUP_SKU, LEASE_SECONDS, QUERY_PARAM_ALLOWLIST, QUERY_PARAM_DENYLIST, TRAILING_SLASH, PATTERN_PAGE_BUDGET, CALENDAR_PAGE_BUDGET, MAX_PATH_DEPTH, FRONTIER_ORDER, LOG_SNAPSHOT_INTERVAL, LOG_REPEAT_LIMIT, METRICS, METRICS_PORT, METRICS_DUMP_INTERVAL, PROFILE_PAGES, PARSER_BACKEND, LISTING_REQUIRED_FIELDS, URL_PRUNING, PRUNE_MIN_PAGES, PRUNE_YIELD_THRESHOLD, PRUNE_EXPLORE_EVERY, ARCHIVE, REPLAY_CHUNK_SIZE, ARCHIVE_MAX_PENDING, READ_CHUNK_SIZE, MAX_PAGE_SIZE
+from http_cache import HttpCache
+from checkpoint import CrawlCheckpoint
+from seen_store import create_seen_store
+from sitemap import SitemapError, iter_sitemap_urls
+from rate_limiter import RateLimiter, parse_retry_after
+from transport import create_session, TransportStats, is_html_content_type, page_encoding
+from export import ExportPipeline
+from distributed import create_frontier_backend, shard_path
+from delta import DeltaStore, page_fingerprint, product_fingerprint
+from listing import extract_listing_products
+from structured_data import extract_structured_product
+from extraction_plan import ExtractionPlan
+from canonical import Canonicalizer, TrapDetector
+from parser_backend import create_parser_backend, get_parser_backend
+from frontier import PriorityFrontier
+from url_learner import UrlPatternLearner, SAVED_MODEL_WEIGHT
+from archive import WarcWriter, read_index, read_record
+from log_pipeline import LogPipeline
+from metrics import Metrics, MetricsReporter
 from threading import Timer
 from datetime import datetime
 import psutil
 import time
+import cProfile
 
 class Scraper:
     def __init__(self):
@@ -19,56 +39,199 @@ class Scraper:
         self.settings = {}
         self.adv_settings = {}
         self.product_qty = 0
+        self.visited_count = 0
+        self.job_finished = False
+        self.discovery_complete = True
+        # products of a delta job which were found unchanged and so not exported
+        self.unchanged_qty = 0
+        self.parse_executor = None
+        self.blacklist_pattern = None
+        self.http_cache = None
+        self.checkpoint = None
+        self.seen_store = None
+        self.delta = None
+        self.canonicalizer = Canonicalizer(QUERY_PARAM_ALLOWLIST, QUERY_PARAM_DENYLIST, TRAILING_SLASH)
+        self.trap_detector = None
+        self.url_learner = None
+        self.patterns_path = None
+        self.archive = None
+        self.rate_limiter = RateLimiter()
+        self.transport_stats = TransportStats()
+        self.metrics = None
+        self.profiler = None
+        self.profile_path = None
 
         if SPEED_TEST_MODE:
             self.average_cpu_usage = 0
             self.max_memory_usage = 0
 
-    async def fetch(self, session, url, headers, log_queue, retries=RESPONSE_RETRY, initial_timeout=RESPONSE_TIMEOUT):
-        """ Asynchronous HTTP GET request with retries and exponential backoff for timeouts """
+    async def fetch(self, session, url, headers, log_queue, retries=RESPONSE_RETRY):
+        """ Asynchronous HTTP GET request with per host rate limiting, retries and exponential backoff for timeouts """
+        host_limiter = self.rate_limiter.for_url(url)
+        backoff_time = 0
+        # The cache is read before a request slot of the host is taken
+        request_headers = await self.http_cache.conditional_headers(url, headers) if self.http_cache else headers
         for attempt in range(1, retries + 1):
+            if backoff_time:
+                # Only this request backs off, the other requests to the host go on at the adapted rate
+                await asyncio.sleep(backoff_time)
+                backoff_time = 0
+            status, retry_after = None, None
+            await host_limiter.acquire()
+            started = time.monotonic()
             try:
-                async with session.get(url, headers=headers, timeout=initial_timeout) as response:
+                async with session.get(url, headers=request_headers) as response:
+                    status = response.status
+                    retry_after = response.headers.get("Retry-After")
+                    if response.status == 304 and self.http_cache:
+                        cached_text = await self.http_cache.get(url)
+                        if cached_text is not None:
+                            return cached_text
+                    if response.status in (429, 503) and attempt < retries:
+                        if self.metrics:
+                            self.metrics.inc("retries_total", reason="throttled")
+                        log_queue.error(f"Throttled: {response.status} for {url} on attempt {attempt}/{retries}")
+                        # With a Retry-After the host limiter holds back the next attempt, without one it backs off exponentially
+                        if not parse_retry_after(retry_after):
+                            backoff_time = 2 ** (attempt - 1)
+                        continue
                     if response.status == 403:
-                        log_queue.put(f"Access denied: 403 Forbidden for {url}")
-                        logging.error(f"Access denied: 403 Forbidden for {url}")
+                        log_queue.error(f"Access denied: 403 Forbidden for {url}")
                         return None
                     elif response.status != 200:
-                        log_queue.put(f"Non-200 status code {response.status} ({response.reason}) for {url}")
-                        logging.error(f"Non-200 status code {response.status} ({response.reason}) for {url}")
+                        log_queue.error(f"Non-200 status code {response.status} ({response.reason}) for {url}")
                         return None
-                    return await response.text()
+                    response_text = await self.read_page(response, url, log_queue)
+                    if response_text is not None and self.http_cache:
+                        await self.http_cache.store(url, response.headers, response_text)
+                    return response_text
             
             except asyncio.TimeoutError:
-                log_queue.put(f"Timeout error for {url} on attempt {attempt}/{retries}")
-                logging.error(f"Timeout error for {url} on attempt {attempt}/{retries}")
+                log_queue.error(f"Timeout error for {url} on attempt {attempt}/{retries}")
+                if self.metrics:
+                    self.metrics.inc("fetch_errors_total", kind="timeout")
                 if attempt < retries:
                     # Wait before retrying, with exponential backoff
+                    if self.metrics:
+                        self.metrics.inc("retries_total", reason="timeout")
                     backoff_time = 2 ** (attempt - 1)
-                    await asyncio.sleep(backoff_time)
                 else:
-                    log_queue.put(f"Failed to fetch {url} after {retries} attempts due to timeout.")
-                    logging.error(f"Failed to fetch {url} after {retries} attempts due to timeout.")
+                    log_queue.error(f"Failed to fetch {url} after {retries} attempts due to timeout.")
                     return None
 
             except aiohttp.ClientConnectionError as e:
-                log_queue.put(f"Connection error for {url}: {e}")
-                logging.error(f"Connection error for {url}: {e}")
+                log_queue.error(f"Connection error for {url}: {e}")
+                if self.metrics:
+                    self.metrics.inc("fetch_errors_total", kind="connection")
                 return None
 
             except Exception as e:
-                log_queue.put(f"Unexpected error fetching {url}: {e.__class__.__name__} - {e}")
-                logging.error(f"Unexpected error fetching {url}: {e.__class__.__name__} - {e}")
+                log_queue.error(f"Unexpected error fetching {url}: {e.__class__.__name__} - {e}")
+                if self.metrics:
+                    self.metrics.inc("fetch_errors_total", kind="other")
                 return None
 
-    async def start_scraping(self):
+            finally:
+                elapsed = time.monotonic() - started
+                await host_limiter.release(status, elapsed, retry_after)
+                # From the request until the body has been read, including the DNS lookup and connect of a new connection
+                if self.metrics and status is not None:
+                    self.metrics.observe("download", elapsed)
+                    self.metrics.inc("responses_total", status=status)
+
+    async def read_page(self, response, url, log_queue):
+        """ Stream the body of a page in chunks and decode it, None for responses which are no HTML or larger than MAX_PAGE_SIZE
+
+        The headers are checked before the body is read, a response without Content-Length gets aborted as soon as it
+        exceeds the size, so the memory of every page in flight stays capped. An aborted response closes its connection.
+        """
+        content_type = response.headers.get("Content-Type", "")
+        if not is_html_content_type(content_type):
+            self.skip_response(url, f"no HTML page ({content_type.split(';', 1)[0].strip()})", "content_type", log_queue)
+            return None
+        content_length = response.headers.get("Content-Length", "")
+        if content_length.isdigit() and int(content_length) > MAX_PAGE_SIZE:
+            self.skip_response(url, f"{int(content_length) // 1024} KB exceed MAX_PAGE_SIZE", "size", log_queue)
+            return None
+
+        body = bytearray()
+        async for chunk in response.content.iter_chunked(READ_CHUNK_SIZE):
+            body += chunk
+            if len(body) > MAX_PAGE_SIZE:
+                self.skip_response(url, "the page exceeds MAX_PAGE_SIZE", "size", log_queue)
+                return None
+        return body.decode(page_encoding(content_type, body), errors="replace")
+
+    def skip_response(self, url, reason, kind, log_queue):
+        log_queue.put(f"Skipped {url}: {reason}")
+        if self.metrics:
+            self.metrics.inc("skipped_responses_total", reason=kind)
+
+    async def start_scraping(self, session=None, parse_executor=None, http_cache=None, metrics=None):
+        """ Prepare and run a scraping job, a shared session, parse executor, HTTP cache and metrics can be handed in (they are not closed here) """
         self.stop_flag.clear()
 
-        log_queue = self.settings.get("log_queue")
+        # Repeated messages are sampled and the progress comes as periodic snapshots, so the log output is never flooded
+        log_queue = LogPipeline(self.settings.get("log_queue"), LOG_REPEAT_LIMIT)
+
+        # Prepare the output path, every export format adds its own file extension
+        output_dir = self.settings.get("output_dir") or EXPORT_DIR
+        output_path = os.path.join(output_dir, self.settings.get("output_name") or "scraped_products")
+        # The sinks, the checkpoint and the stores open their files right away, e.g. on a server without a Desktop folder
+        os.makedirs(output_dir, exist_ok=True)
+        # In distributed mode every worker writes its own shard, see distributed.merge_shards
+        if self.settings.get("frontier_backend"):
+            output_path = shard_path(output_path)
+
+        # A replay re-extracts a recorded crawl instead of crawling
+        if self.settings.get("replay"):
+            try:
+                await self.replay_archive(output_path, parse_executor, log_queue)
+            finally:
+                log_queue.close()
+            return
 
-        # Prepare the CSV file path
-        desktop_path = os.path.join(os.path.expanduser("~"), "Desktop")
-        csv_file_path = os.path.join(desktop_path, "scraped_products.csv")
+        # Start with fresh per host limits and transport stats on every job, sized for its concurrency
+        concurrency = self.settings.get("concurrency") or SIMULTANEOUS_SCRAPS
+        self.rate_limiter = RateLimiter(self.settings.get("concurrency") or HOST_MAX_CONCURRENCY)
+        self.transport_stats = TransportStats()
+
+        # Open the store of already enqueued URLs
+        self.seen_store = create_seen_store(SEEN_STORE, BLOOM_FALSE_POSITIVE_RATE, f"{output_path}.seen")
+
+        # Open the checkpoint and check whether there is an unfinished crawl of the same URL to resume
+        # (in distributed mode the shared frontier keeps the state of the job, a worker has no checkpoint of its own)
+        self.checkpoint = None
+        resume = False
+        if self.settings.get("frontier_backend"):
+            if self.settings.get("resume"):
+                log_queue.put("Resume is not available in distributed mode, the shared frontier keeps the state of the job.")
+        else:
+            self.checkpoint = CrawlCheckpoint(f"{output_path}.checkpoint")
+            resume = bool(self.settings.get("resume")) and self.checkpoint.can_resume(self.settings.get("url"))
+            if self.settings.get("resume") and not resume:
+                log_queue.put("No unfinished crawl of this URL found, starting a new one.")
+            if not resume:
+                self.checkpoint.start(self.settings.get("url"))
+
+        # Open the fingerprints of the last run, so only the changed products get extracted and exported
+        # (every distributed worker sees other URLs, so their runs can't be compared)
+        self.delta = None
+        self.unchanged_qty = 0
+        if self.settings.get("delta") and self.settings.get("frontier_backend"):
+            log_queue.put("Delta mode is not available in distributed mode, exporting all products.")
+        elif self.settings.get("delta"):
+            self.delta = DeltaStore(f"{output_path}.delta.sqlite3", f"{output_path}.changes.jsonl", resume)
+
+        # Continue with the URL patterns learned on the last run of this shop (a resumed job with its own ones)
+        self.url_learner = UrlPatternLearner(self.settings.get("product_identifier"), URL_PRUNING, PRUNE_MIN_PAGES, PRUNE_YIELD_THRESHOLD, PRUNE_EXPLORE_EVERY)
+        self.patterns_path = f"{output_path}.patterns.json"
+        if self.url_learner.load(self.patterns_path, 1.0 if resume else SAVED_MODEL_WEIGHT):
+            log_queue.put("Using the URL patterns learned on the last run.")
+
+        # Record the fetched pages for a replay, a resumed crawl appends to its archive
+        if self.settings.get("archive") or ARCHIVE:
+            self.archive = WarcWriter(f"{output_path}.warc.gz", resume, log_queue, ARCHIVE_MAX_PENDING)
 
         if SPEED_TEST_MODE:
             now = datetime.now()
@@ -82,14 +245,200 @@ class Scraper:
 
         # reformat any settings to be used
         self.adv_settings["formatted_blacklist"] = self.str_to_array_by_linebrake(self.adv_settings["blacklist"])
+        self.compile_blacklist()
+
+        # Report an unavailable parser backend right away, the parse workers fall back to lxml
+        try:
+            create_parser_backend(self.settings.get("parser_backend") or PARSER_BACKEND)
+        except (ValueError, ImportError) as e:
+            log_queue.error(f"Parser backend not available ({e}), parsing with lxml.")
+
+        # Report invalid product element selectors right away, the parse workers compile their own plan
+        if self.settings.get("mode") == "html":
+            for error in ExtractionPlan(self.settings.get("prod_els")).errors:
+                log_queue.error(error)
+
+        # Open the on-disk HTTP cache
+        own_http_cache = http_cache is None and HTTP_CACHE
+        self.http_cache = http_cache or (HttpCache(HTTP_CACHE_DIR, HTTP_CACHE_MAX_SIZE, HTTP_CACHE_MAX_AGE, HTTP_CACHE_MAX_PENDING) if HTTP_CACHE else None)
+
+        # Start the executor for the parse stage, so the CPU work doesn't stall the event loop
+        own_parse_executor = parse_executor is None
+        self.parse_executor = parse_executor or self.create_parse_executor()
+
+        # Opt-in stage timers and counters, served for Prometheus and dumped as JSON next to the output
+        reporter = None
+        self.metrics = metrics
+        if metrics is None and (self.settings.get("metrics") or METRICS):
+            self.metrics = Metrics()
+            reporter = MetricsReporter(self.metrics, METRICS_PORT, f"{output_path}.metrics.json", METRICS_DUMP_INTERVAL)
+            try:
+                await reporter.start()
+            except OSError as e:
+                log_queue.error(f"Metrics endpoint not available on port {METRICS_PORT}: {e}")
+            if METRICS_PORT:
+                log_queue.put(f"Metrics: http://127.0.0.1:{METRICS_PORT}/metrics")
+
+        # Profile the first pages, see stop_profiler
+        if PROFILE_PAGES:
+            self.profile_path = f"{output_path}.prof"
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
 
         # Open session for aiohttp and initiate the scraping process
-        async with aiohttp.ClientSession() as session:
-            with open(csv_file_path, mode='w', newline='', encoding='utf-8') as file:
-                writer = csv.DictWriter(file, fieldnames=['name', 'image', 'desc', 'sku', 'price', 'url'])
-                writer.writeheader()
+        try:
+            if session is None:
+                async with create_session(self.transport_stats, self.metrics, concurrency) as own_session:
+                    await self.export_and_scrape(own_session, output_path, resume, log_queue)
+                log_queue.put(self.transport_stats.summary())
+            else:
+                await self.export_and_scrape(session, output_path, resume, log_queue)
+        finally:
+            if self.parse_executor and own_parse_executor:
+                self.parse_executor.shutdown(wait=False, cancel_futures=True)
+            self.parse_executor = None
+            if self.http_cache and own_http_cache:
+                log_queue.put(f"HTTP cache: {self.http_cache.hits} pages not modified, {self.http_cache.misses} downloaded.")
+                self.http_cache.close()
+            self.http_cache = None
+            if self.checkpoint:
+                self.checkpoint.close()
+            self.checkpoint = None
+            self.seen_store.close()
+            if self.trap_detector:
+                log_queue.put(self.trap_detector.summary())
+            if self.archive:
+                self.archive.close()
+                log_queue.put(self.archive.summary())
+                self.archive = None
+            if self.url_learner.total[0]:
+                self.url_learner.save(self.patterns_path)
+                log_queue.put(self.url_learner.summary())
+            if self.delta:
+                # Products can only be told removed after a complete crawl of all URLs, with all sitemaps read
+                if self.job_finished and self.discovery_complete and not self.settings.get("sitemap_since"):
+                    self.delta.finish()
+                elif not self.discovery_complete:
+                    log_queue.put("Delta: removed products are not reported, the sitemaps have not been read completely.")
+                log_queue.put(self.delta.summary())
+                self.unchanged_qty = self.delta.unchanged
+                self.delta.close()
+                self.delta = None
+            self.stop_profiler(log_queue)
+            if self.metrics:
+                log_queue.put(self.metrics.summary())
+                if reporter:
+                    await reporter.close()
+            self.metrics = None
+            log_queue.close()
+
+    async def export_and_scrape(self, session, output_path, resume, log_queue):
+        """ Run the scrape task with an export pipeline, when resuming the existing output files are appended to """
+        exporter = ExportPipeline(
+            output_path,
+            self.settings.get("export_formats") or EXPORT_FORMATS,
+            resume,
+            EXPORT_BATCH_SIZE,
+            EXPORT_FLUSH_INTERVAL,
+            EXPORT_DEDUP_SKU,
+            log_queue,
+            self.metrics,
+        )
+        try:
+            await self.scrape_task(session, exporter, log_queue, resume)
+        finally:
+            await exporter.close()
+
+    async def replay_archive(self, output_path, parse_executor, log_queue):
+        """ Re-extract the products and links of the pages recorded in <output>.warc.gz, without any request
+
+        The pages are parsed in chunks by the parse workers (a process pool of its own, unless one is handed in),
+        the results are exported in the order of the crawl, so a replay of the same archive gives the same output.
+        """
+        archive_path = f"{output_path}.warc.gz"
+        self.job_finished = False
+        self.visited_count = 0
+        self.product_qty = 0
+        try:
+            entries = read_index(archive_path)
+        except OSError as e:
+            log_queue.put(f"No recorded crawl to replay: {e}")
+            return
 
-                await self.scrape_task(session, writer, log_queue)
+        self.adv_settings["formatted_blacklist"] = self.str_to_array_by_linebrake(self.adv_settings["blacklist"])
+        self.compile_blacklist()
+        follow_links = self.settings.get("discovery", "crawl") != "sitemap"
+        replay_args = (
+            self.settings.get("product_identifier"), self.settings.get("mode"), self.settings.get("prod_els"), self.adv_settings["formatted_blacklist"],
+            follow_links, self.settings.get("parser_backend") or PARSER_BACKEND, bool(self.settings.get("listing")),
+        )
+        log_queue.put(f"Replaying {len(entries)} recorded pages from {archive_path} ...")
+        started = time.monotonic()
+
+        # The replay is CPU bound only, so it always runs on all cores
+        own_parse_executor = parse_executor is None
+        parse_executor = parse_executor or ProcessPoolExecutor(max_workers=PARSE_WORKERS)
+        # A few chunks per worker in flight keep every core busy while the results are exported in order
+        max_in_flight = 2 * (PARSE_WORKERS or os.cpu_count() or 1)
+        loop = asyncio.get_running_loop()
+        in_flight = deque()
+        recorded = {url for url, _, _ in entries}
+        missing_links = set()
+        exported = set()
+        exporter = ExportPipeline(output_path, self.settings.get("export_formats") or EXPORT_FORMATS, False, EXPORT_BATCH_SIZE, EXPORT_FLUSH_INTERVAL, EXPORT_DEDUP_SKU, log_queue)
+        try:
+            chunks = (entries[start:start + REPLAY_CHUNK_SIZE] for start in range(0, len(entries), REPLAY_CHUNK_SIZE))
+            for chunk in chunks:
+                in_flight.append(loop.run_in_executor(parse_executor, replay_records, archive_path, chunk, *replay_args))
+                if len(in_flight) < max_in_flight:
+                    continue
+                for result in await in_flight.popleft():
+                    self.replay_result(result, recorded, missing_links, exported, exporter, log_queue)
+                if self.stop_flag.is_set():
+                    break
+                if log_queue.snapshot_due(LOG_SNAPSHOT_INTERVAL):
+                    log_queue.snapshot(self.visited_count, "Remaining", len(entries) - self.visited_count, self.product_qty)
+
+            while in_flight and not self.stop_flag.is_set():
+                for result in await in_flight.popleft():
+                    self.replay_result(result, recorded, missing_links, exported, exporter, log_queue)
+            self.job_finished = not self.stop_flag.is_set()
+        finally:
+            for future in in_flight:
+                future.cancel()
+            await exporter.close()
+            if own_parse_executor:
+                parse_executor.shutdown(wait=False, cancel_futures=True)
+
+        elapsed = time.monotonic() - started
+        log_queue.put(f"Replay: {self.visited_count} pages, {self.product_qty} products in {elapsed:.1f} s ({self.visited_count / max(elapsed, 0.001):.0f} pages/s).")
+        if follow_links:
+            log_queue.put(f"Replay: {len(missing_links)} linked URLs are not in the archive, a crawl would fetch them.")
+        logging.info("Scraping job finished.")
+        log_queue.put("Scraping job finished.")
+
+    def replay_result(self, result, recorded, missing_links, exported, exporter, log_queue):
+        """ Export the products of a replayed page and note its links which have never been recorded """
+        url, product_info, links, log_messages, listed_products = result
+        self.visited_count += 1
+        for log_message in log_messages:
+            log_queue.error(log_message)
+        missing_links.update(link for link in links if link not in recorded)
+
+        # A listed product may have been recorded with its detail page as well
+        products = ([(url, product_info)] if product_info else []) + [(product["url"], product) for product in listed_products]
+        for product_url, product in products:
+            if product_url not in exported:
+                exported.add(product_url)
+                self.export_product(product_url, product, exporter)
+
+    def create_parse_executor(self):
+        """ Create the executor for the parse stage according to PARSE_EXECUTOR """
+        if PARSE_EXECUTOR == "process":
+            return ProcessPoolExecutor(max_workers=PARSE_WORKERS)
+        if PARSE_EXECUTOR == "thread":
+            return ThreadPoolExecutor(max_workers=PARSE_WORKERS)
+        return None
 
     def stop_scraping(self):
         if SPEED_TEST_MODE:
@@ -103,222 +452,375 @@ class Scraper:
             self.max_memory_usage = round(self.max_memory_usage, 0)
             print(f"Average CPU Usage: {self.average_cpu_usage}%")
             print(f"Max Memory Usage: {self.max_memory_usage} MB")
+            if self.seen_store:
+                print(f"Seen-URL Store ({SEEN_STORE}): {len(self.seen_store)} URLs in {round(self.seen_store.memory_usage() / (1024 * 1024), 1)} MB")
 
         self.stop_flag.set()
 
-    async def scrape_task(self, session, writer, log_queue):
+    async def scrape_task(self, session, exporter, log_queue, resume=False):
         """ Main asynchronous scraping task """
         headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3"}
         start_url = self.settings.get("url")
         mode = self.settings.get("mode")
         product_identifier = self.settings.get("product_identifier")
         prod_els = self.settings.get("prod_els")
+        # "crawl" follows every link from the start URL, "sitemap" only fetches the product URLs listed in the sitemaps
+        follow_links = self.settings.get("discovery", "crawl") != "sitemap"
+
+        # the quantity of simultaneous scraping tasks can be lowered per job, e.g. to share a budget across shops
+        concurrency = self.settings.get("concurrency") or SIMULTANEOUS_SCRAPS
+        self.job_finished = False
+        # set by feed_from_sitemaps if a sitemap fails, the pages of a job with incomplete sitemaps are no complete crawl
+        self.discovery_complete = True
 
         if not self.is_valid_url(start_url):
             log_queue.put("Invalid URL. Please provide a valid URL.")
             return
+        start_url = self.canonicalizer.canonicalize(start_url)
+        self.trap_detector = TrapDetector(product_identifier, PATTERN_PAGE_BUDGET, CALENDAR_PAGE_BUDGET, MAX_PATH_DEPTH)
         
         log_queue.put("Starting scraping ...")
         logging.info("Starting scraping...")
 
-        # domain = urlparse(start_url).netloc where does this go?
-        to_visit = {start_url}
-        visited = set()
-        tasks = []
-
-        while to_visit or tasks:
-            # If stop_flag is set, break out of the loop
-            if self.stop_flag.is_set():
-                break
-
-            if to_visit:
-                current_url = to_visit.pop()
-                if current_url not in visited:
-                    # logging.info(f"Crawling: {current_url}")
-                    visited.add(current_url)
-                    task = self.process_url(session, current_url, headers, visited, to_visit, product_identifier, mode, prod_els, writer, log_queue)
-                    tasks.append(task)
+        # In distributed mode the frontier and the seen-set live in a backend shared by all workers
+        if self.settings.get("frontier_backend"):
+            await self.distributed_task(session, exporter, log_queue, start_url, headers, product_identifier, mode, prod_els, concurrency)
+            logging.info(f"Scraping job finished.")
+            log_queue.put(f"Scraping job finished.")
+            self.stop_scraping()
+            return
 
-            # Limit the number of concurrent tasks
-            if len(tasks) >= SIMULTANEOUS_SCRAPS or not to_visit:
-                await asyncio.gather(*tasks)
-                tasks = []  # Reset task list after processing
+        # The frontier holds the URLs waiting to be fetched, the most promising first, dedup happens when a URL is enqueued
+        # In sitemap mode it only gets product pages in their order and is bounded, so the sitemaps are only streamed as fast as the pages get fetched
+        if follow_links:
+            frontier = PriorityFrontier(product_identifier, FRONTIER_ORDER, metrics=self.metrics, products_first=not self.settings.get("listing"), learner=self.url_learner)
+        else:
+            frontier = PriorityFrontier(product_identifier, "fifo", maxsize=concurrency * 4, metrics=self.metrics)
+        enqueued = self.seen_store
+        if resume:
+            pending, self.visited_count = self.checkpoint.load()
+            for url in self.checkpoint.iter_enqueued():
+                enqueued.add(url)
+                self.trap_detector.check(url)
+            self.product_qty = len(self.checkpoint.exported)
+            log_queue.put(f"Resuming crawl: {self.visited_count} pages visited, {len(pending)} queuing.")
+        elif follow_links:
+            pending = [start_url]
+            enqueued.add(start_url)
+            self.checkpoint.add_enqueued(pending)
+        else:
+            pending = []
+        if not resume:
+            self.visited_count = 0
+            self.product_qty = 0
+
+        # Start a fixed pool of long-lived workers, so the concurrency stays at the configured level all the time
+        workers = [
+            asyncio.create_task(self.crawl_worker(session, frontier, enqueued, headers, product_identifier, mode, prod_els, follow_links, exporter, log_queue))
+            for _ in range(concurrency)
+        ]
+
+        if follow_links:
+            for url in pending:
+                frontier.put_nowait(url)
+            drained = asyncio.create_task(frontier.join())
+        else:
+            producer = asyncio.create_task(self.feed_from_sitemaps(session, frontier, enqueued, pending, start_url, headers, product_identifier, log_queue))
+            drained = asyncio.create_task(self.wait_until_drained(frontier, producer))
+
+        # Wait until the frontier is drained or the stop_flag has been set (it may be set from another thread, so poll it)
+        last_checkpoint = time.monotonic()
+        while not drained.done() and not self.stop_flag.is_set():
+            await asyncio.wait({drained}, timeout=0.5)
+
+            # Checkpoint the crawl state in regular intervals
+            if time.monotonic() - last_checkpoint >= CHECKPOINT_INTERVAL:
+                await self.save_checkpoint(exporter)
+                if follow_links:
+                    self.url_learner.save(self.patterns_path)
+                last_checkpoint = time.monotonic()
+
+            # console log
+            if log_queue.snapshot_due(LOG_SNAPSHOT_INTERVAL):
+                log_queue.snapshot(self.visited_count, "Queuing", frontier.qsize(), self.product_qty)
+
+        finished = drained.done() and not self.stop_flag.is_set() and self.discovery_complete
+        drained.cancel()
+        if not follow_links:
+            producer.cancel()
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        await self.save_checkpoint(exporter, finished)
+        self.job_finished = finished
+        log_queue.snapshot(self.visited_count, "Queuing", frontier.qsize(), self.product_qty)
 
         logging.info(f"Scraping job finished.")
         log_queue.put(f"Scraping job finished.")
         self.stop_scraping()
 
-    async def process_url(self, session, url, headers, visited, to_visit, product_identifier, mode, prod_els, writer, log_queue):
-        """ Process a single URL asynchronously """
-        response_text = await self.fetch(session, url, headers, log_queue)
-        if response_text is None:
-            return
+    async def save_checkpoint(self, exporter, finished=False):
+        """ Checkpoint the crawl once the products of its visited pages are written, so a crash right after loses none of them """
+        changes = self.checkpoint.take_changes()
+        await exporter.flush()
+        self.checkpoint.save(finished, changes)
 
-        soup = BeautifulSoup(response_text, 'lxml')
-
-        # If the URL contains the product identifier, extract product info
-        if product_identifier in url:
-            product_info = self.extract_product_info(url, mode, prod_els, log_queue, soup)
-            if product_info:
-                writer.writerow(product_info)
-                self.product_qty += 1
+    async def distributed_task(self, session, exporter, log_queue, start_url, headers, product_identifier, mode, prod_els, concurrency):
+        """ Scrape task of one worker in distributed mode, which leases its URLs from the shared frontier backend """
+        backend = create_frontier_backend(self.settings["frontier_backend"], urlparse(start_url).netloc)
+        self.visited_count = 0
+        self.product_qty = 0
+        if self.settings.get("discovery") == "sitemap":
+            log_queue.put("Sitemap discovery is not available in distributed mode, crawling the links instead.")
 
-        # Find additional links to queue up for scraping
-        new_links = self.get_all_links(url, urlparse(url).netloc, log_queue, soup)
-        to_visit.update(new_links - visited)
+        # The leased URLs wait in a local queue for the workers, one lease per worker at most
+        leased = asyncio.Queue()
+        workers = []
+        try:
+            await backend.add([start_url])
+            workers = [
+                asyncio.create_task(self.distributed_worker(session, backend, leased, headers, product_identifier, mode, prod_els, exporter, log_queue))
+                for _ in range(concurrency)
+            ]
+
+            while not self.stop_flag.is_set():
+                # console log
+                if log_queue.snapshot_due(LOG_SNAPSHOT_INTERVAL):
+                    log_queue.snapshot(self.visited_count, "Leased", leased.qsize(), self.product_qty)
+
+                if leased.qsize() < concurrency:
+                    urls = await backend.lease(concurrency - leased.qsize(), LEASE_SECONDS)
+                    for url in urls:
+                        leased.put_nowait(url)
+                    if urls:
+                        continue
+
+                # Nothing left to lease: done once no worker anywhere holds a lease anymore
+                queued, in_lease, done = await backend.counts()
+                if not queued and not in_lease:
+                    self.job_finished = True
+                    log_queue.put(f"Shared frontier drained: {done} pages visited by all workers.")
+                    break
+
+                # Leases of crashed workers expire and are handed out again
+                await backend.requeue_expired()
+                await asyncio.sleep(0.5)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            await backend.close()
+            log_queue.snapshot(self.visited_count, "Leased", leased.qsize(), self.product_qty)
+
+    async def distributed_worker(self, session, backend, leased, headers, product_identifier, mode, prod_els, exporter, log_queue):
+        """ Long-lived worker of the distributed mode, reports the found links and the completed URL to the backend """
+        while True:
+            current_url = await leased.get()
+            if self.stop_flag.is_set():
+                # Not completed, so the lease expires and another worker takes over
+                continue
 
-        # console log
-        log_queue.put(f"Visited: {len(visited)} | Queuing: {len(to_visit)} | product{"" if self.product_qty == 1 else "s"}: {self.product_qty}.")
+            try:
+                self.visited_count += 1
+                links = await self.process_url(session, current_url, headers, product_identifier, mode, prod_els, True, exporter, log_queue)
+                # Every worker applies the page budgets to the links it found itself, the links it has seen before are counted once
+                new_links = list(self.filter_traps((link for link in links if link not in self.seen_store), log_queue))
+                for link in new_links:
+                    self.seen_store.add(link)
+                await backend.add(new_links)
 
+            except Exception as e:
+                log_queue.error(f"Error while processing {current_url}: {e}")
+
+            # Also completed on errors, otherwise a broken page would be leased again and again
+            await backend.complete(current_url)
+
+    def filter_traps(self, links, log_queue):
+        """ Yield the links which are no suspected crawl trap, the first skipped URL of every trap gets logged
+
+        A skipped URL is marked as seen, so finding it again doesn't count against the budget of its pattern once more.
+        """
+        for link in links:
+            reason = self.trap_detector.check(link)
+            if reason is None:
+                yield link
+                continue
+            self.seen_store.add(link)
+            if self.trap_detector.skipped[reason] == 1:
+                log_queue.put(f"Crawl trap suspected ({reason}), skipping URLs like {link}")
+                logging.info(f"Crawl trap suspected ({reason}), skipping URLs like {link}")
+
+    def filter_low_yield(self, links, depth, log_queue):
+        """ Yield the links which are not dropped by the URL pattern learner, the first dropped URL of every template gets logged """
+        for link in links:
+            template = self.url_learner.prune(link, depth)
+            if template is None:
+                yield link
+            elif self.url_learner.pruned[template] == 1:
+                log_queue.put(f"Low product yield of {template}, skipping URLs like {link}")
+                logging.info(f"Low product yield of {template}, skipping URLs like {link}")
+
+    async def feed_from_sitemaps(self, session, frontier, enqueued, pending, start_url, headers, product_identifier, log_queue):
+        """ Feed the pending URLs of a resumed crawl and then the product URLs of the sitemaps into the frontier """
+        for url in pending:
+            await frontier.put(url)
 
-    def extract_product_info(self, url, mode, prod_els, log_queue, soup):
         try:
-            product_info = {}
+            async for url in iter_sitemap_urls(session, start_url, headers, log_queue, self.settings.get("sitemap_since")):
+                url = self.canonicalizer.canonicalize(url)
+                if product_identifier in url and url not in enqueued:
+                    enqueued.add(url)
+                    self.checkpoint.add_enqueued([url])
+                    await frontier.put(url)
+        except SitemapError as e:
+            self.discovery_complete = False
+            log_queue.error(f"Sitemap discovery incomplete: {e}. The job is not marked as finished, resume it to read the sitemaps again.")
+
+    async def wait_until_drained(self, frontier, producer):
+        """ Wait until the producer has fed all URLs and all of them have been processed """
+        await producer
+        await frontier.join()
+
+    async def crawl_worker(self, session, frontier, enqueued, headers, product_identifier, mode, prod_els, follow_links, exporter, log_queue):
+        """ Long-lived worker pulling URLs from the frontier until it gets cancelled """
+        while True:
+            current_url, depth = await frontier.get()
+            try:
+                if self.stop_flag.is_set():
+                    continue
+
+                self.visited_count += 1
+                links = await self.process_url(session, current_url, headers, product_identifier, mode, prod_els, follow_links, exporter, log_queue)
+
+                # Only enqueue links that have never been enqueued before, are not in a low-yield branch and are no suspected crawl trap
+                # Links of low-yield branches are not marked as enqueued, so they get rated again when they are found once more,
+                # they are dropped before the trap check, so only the URLs which do get enqueued count against the page budgets
+                new_links = self.filter_low_yield((link for link in links if link not in enqueued), depth + 1, log_queue)
+                new_links = list(self.filter_traps(new_links, log_queue))
+                frontier.record_yield(current_url, depth, new_links)
+                for link in new_links:
+                    enqueued.add(link)
+                    frontier.put_nowait(link, depth + 1)
+                self.checkpoint.add_enqueued(new_links)
+                self.checkpoint.add_visited(current_url)
 
-            # Handle different modes: JSON-LD or HTML
-            if mode == "json":
-                schema_markups = soup.find_all("script", {"type": "application/ld+json"})
-                for markup in schema_markups:
-                    json_data = markup.string
-
-                    try:
-                        data = json.loads(json_data)
-
-                        if data.get("@type") == "Product":
-                            product_info['name'] = data.get("name", "")
-                            image = data.get("image", "")
-                            product_info['image'] = image[0] if isinstance(image, list) else image
-                            product_info['desc'] = data.get("description", "")
-                            product_info['sku'] = data.get("sku", "")
-                            product_info['price'] = data.get("offers", {}).get("price", "").replace(".", ",")
-                            product_info['url'] = data.get("offers", {}).get("url", url)
-                            return product_info
-                        
-                    except json.JSONDecodeError as e:
-                        logging.error(f"Error parsing JSON from {url}: {e}")
-                        log_queue.put(f"Error parsing JSON from {url}: {e}")
-
-            elif mode == "html":
-                # For HTML mode, use the provided product element classes or default itemprops
-                product_info['name'] = self.find_element(soup, prod_els.get('name'), 'name', log_queue)
-                product_info['image'] = self.find_element(soup, prod_els.get('image'), 'image', log_queue)
-                product_info['desc'] = self.find_element(soup, prod_els.get('desc'), 'description', log_queue)
-                product_info['sku'] = self.find_element(soup, prod_els.get('sku'), 'sku', log_queue)
-                product_info['price'] = self.find_element(soup, prod_els.get('price'), 'price', log_queue)
-                product_info['url'] = url
-
-                return product_info if any(product_info.values()) else None
+            except Exception as e:
+                log_queue.error(f"Error while processing {current_url}: {e}")
 
-        except Exception as e:
-            logging.error(f"Error while scraping {url}: {e}")
-            log_queue.put(f"Error while scraping {url}: {e}")
-            return None
+            finally:
+                frontier.task_done()
 
-    def find_element(self, soup, class_name, itemprop_name, log_queue):
-        # Helper method to find elements by class or itemprop.
-        if class_name:
-            tag = soup.find(class_=class_name)
-        else:
-            tag = soup.find(attrs={"itemprop": itemprop_name})
-
-        if not tag:
-            logging.error(f"{itemprop_name} not found using {'class' if class_name else 'itemprop'}.")
-            log_queue.put(f"{itemprop_name} not found using {'class' if class_name else 'itemprop'}.")
-            return f"No {itemprop_name} found."
-
-        # handle special case for image
-        if itemprop_name == "image":
-            if class_name:
-                image_tag = tag.find("img")
-                if image_tag and "src" in image_tag.attrs:
-                    return image_tag["src"]
-                else:
-                    error_msg = "No image found in parent element!"
-                    logging.error(error_msg)
-                    log_queue.put(error_msg)
-                    return error_msg
-            else:
-                if "content" in tag.attrs:
-                    return tag["content"]
-                if "src" in tag.attrs:
-                    return tag["src"]
-                else:
-                    error_msg = "Image not found with itemprop."
-                    logging.error(error_msg)
-                    log_queue.put(error_msg)
-                    return error_msg
-
-        # handle special case for description in html format
-        if itemprop_name == "description":
-            if class_name:
-                return str(tag)
-            else:
-                if tag.name == "meta":
-                    return tag.get("content", "")
-                # else default 
-                
-        # handle special case for price in html format
-        if itemprop_name == "price":
-            if not class_name:
-                offer = soup.find(attrs={"itemprop": "offers", "itemscope": True})
-                if offer:
-                    if tag.name == "meta":
-                        return tag.get("content", "").replace(".", ",")
-                    else:
-                        return tag.get_text(strip=True).replace(".", ",")
-                else:
-                    error_msg = "No itemprop offer found to get price from!"
-                    logging.error(error_msg)
-                    log_queue.put(error_msg)
-                    return error_msg
-
-        # handles default case
-        if tag.name == "meta":
-            return tag.get("content", "")
+    async def process_url(self, session, url, headers, product_identifier, mode, prod_els, follow_links, exporter, log_queue):
+        """ Process a single URL asynchronously and return the links found on it """
+        if self.profiler and self.visited_count > PROFILE_PAGES:
+            self.stop_profiler(log_queue)
+
+        # The product of a listing page has been exported already, if its detail page was enqueued before the listing page was seen
+        if self.settings.get("listing") and self.checkpoint and self.checkpoint.is_exported(url):
+            return set()
+
+        response_text = await self.fetch(session, url, headers, log_queue)
+        if response_text is None:
+            # A product which failed to load in this run is no removed product
+            if self.delta:
+                self.delta.keep(url)
+            return set()
+        if self.archive:
+            await self.archive.write(url, response_text)
+
+        # Parse the page in the parse executor, which only hands back the compact results
+        # (while profiling on the event loop, so the parse stage shows up in the profile)
+        previous_fingerprint = self.delta.fingerprint(url) if self.delta else None
+        parse_args = (url, response_text, product_identifier, mode, prod_els, self.adv_settings["formatted_blacklist"], follow_links, bool(self.delta), previous_fingerprint, bool(self.metrics), self.settings.get("parser_backend") or PARSER_BACKEND, bool(self.settings.get("listing")))
+        started = time.perf_counter()
+        if self.parse_executor and not self.profiler:
+            loop = asyncio.get_running_loop()
+            product_info, links, log_messages, fingerprint, timings, listed_products = await loop.run_in_executor(self.parse_executor, parse_page, *parse_args)
         else:
-            return tag.get_text(strip=True)        
+            product_info, links, log_messages, fingerprint, timings, listed_products = parse_page(*parse_args)
+
+        # The stages are timed in the parse worker, the rest of the round trip is the wait for a free worker and the transfer
+        if self.metrics:
+            self.metrics.observe_all(timings)
+            self.metrics.observe("parse_wait", max(0.0, time.perf_counter() - started - sum(timings.values())))
+
+        # Forward the messages of the parse stage to both log outputs
+        for log_message in log_messages:
+            log_queue.error(log_message)
+
+        # In delta mode unchanged products are neither extracted nor exported, the change feed gets the changed ones
+        if self.delta and fingerprint is not None:
+            if fingerprint == previous_fingerprint:
+                self.delta.touch(url)
+            elif product_info:
+                self.delta.record(url, fingerprint, product_info)
+
+        if product_info:
+            self.export_product(url, product_info, exporter)
+
+        # The complete products of a listing page are exported right away, their detail pages are never enqueued
+        for listed_product in listed_products:
+            listed_url = listed_product["url"]
+            self.seen_store.add(listed_url)
+            if self.delta:
+                listed_fingerprint = product_fingerprint(listed_product)
+                if listed_fingerprint == self.delta.fingerprint(listed_url):
+                    self.delta.touch(listed_url)
+                    continue
+                self.delta.record(listed_url, listed_fingerprint, listed_product)
+            self.export_product(listed_url, listed_product, exporter)
+
+        return links
 
-    def get_all_links(self, url, domain, log_queue, soup):
+    def export_product(self, url, product_info, exporter):
+        """ Hand a product to the export pipeline, products exported before an interruption are not written again when resuming """
+        if self.checkpoint and self.checkpoint.is_exported(url):
+            return
+        # Products with an already exported SKU are skipped by the pipeline and not counted
+        if exporter.put(product_info):
+            self.product_qty += 1
+        if self.checkpoint:
+            self.checkpoint.add_exported(url)
+
+    def stop_profiler(self, log_queue):
+        """ Stop the profiler of the first pages and write its stats, e.g. for python -m pstats or snakeviz """
+        if not self.profiler:
+            return
+        self.profiler.disable()
+        self.profiler.dump_stats(self.profile_path)
+        self.profiler = None
+        log_queue.put(f"Profile of the first {PROFILE_PAGES} pages written to {self.profile_path}")
+
+    def compile_blacklist(self):
+        """ Compile the advanced and the general blacklist into a single regex, so every link is matched only once """
+        blacklist = self.adv_settings["formatted_blacklist"] + GENERAL_BLACKLIST
+        self.blacklist_pattern = re.compile("|".join(map(re.escape, blacklist))) if blacklist else None
+
+    def get_all_links(self, url, domain, log_queue, hrefs):
+        """ Canonicalize and filter the hrefs of a page in a single pass """
         links = set()
 
         parsed_url = urlparse(url)
         base_url = f"{parsed_url.scheme}://{parsed_url.netloc}"
-
-        def add_link(normalized_link):
-            if (
-                domain in normalized_link
-                and not any(blacklisted_url in normalized_link for blacklisted_url in self.adv_settings["formatted_blacklist"])
-                and not any(general_url in normalized_link for general_url in GENERAL_BLACKLIST)
-                and not normalized_link.endswith(EXCLUDED_EXTENSIONS)
-            ):
-                links.add(normalized_link)
-                # logging.info(f"Link found: {normalized_link}")
+        blacklist_pattern = self.blacklist_pattern
 
         try:
-            # First, get all <a> tags directly (as in original code)
-            for a_tag in soup.find_all("a", href=True):
-                relative_link = a_tag['href']
+            for relative_link in hrefs:
                 full_link = urljoin(base_url, relative_link)
-                parsed_link = urlparse(full_link)
-                normalized_link = urlunparse(parsed_link._replace(fragment=""))
+                normalized_link = self.canonicalizer.canonicalize(full_link)
+
+                if normalized_link in links:
+                    continue
+
+                if (
+                    domain in normalized_link
+                    and not (blacklist_pattern and blacklist_pattern.search(normalized_link))
+                    and not normalized_link.endswith(EXCLUDED_EXTENSIONS)
+                ):
+                    links.add(normalized_link)
 
-                add_link(normalized_link)
-            
-            # Look deeper into nested divs or other elements if necessary
-            for div in soup.find_all(['div', 'nav', 'ul', 'li', 'span']):
-                nested_a_tags = div.find_all("a", href=True)
-                for nested_a_tag in nested_a_tags:
-
-                    relative_link = nested_a_tag['href']
-                    full_link = urljoin(base_url, relative_link)
-                    parsed_link = urlparse(full_link)
-                    normalized_link = urlunparse(parsed_link._replace(fragment=""))
-
-                    add_link(normalized_link)
-                    
         except Exception as e:
-            logging.error(f"Error while fetching links from {url}: {e}")
-            log_queue.put(f"Error while fetching links from {url}: {e}")
+            log_queue.error(f"Error while fetching links from {url}: {e}")
         return links
 
     def is_valid_url(self, url):
@@ -333,7 +835,8 @@ class Scraper:
         process = psutil.Process()
         sample_count = 0
         cumulative_cpu_usage = 0
-        while True:
+        # Runs until the job gets stopped, not on for the rest of the process
+        while not self.stop_flag.is_set():
             # Get current CPU and memory usage
             sample_count += 1
             cpu_usage = process.cpu_percent(interval=0.1)
@@ -343,4 +846,118 @@ class Scraper:
             cumulative_cpu_usage += cpu_usage
             self.average_cpu_usage = cumulative_cpu_usage / sample_count
             self.max_memory_usage = max(self.max_memory_usage, memory_usage)
-            time.sleep(0.1)  # Adjust the interval as needed
\ No newline at end of file
+            time.sleep(0.1)  # Adjust the interval as needed
+
+
+class LogCollector(list):
+    """ Collects the log messages of the parse stage, so they can be handed back from a worker process """
+    def put(self, message):
+        self.append(message)
+
+    # all messages of the parse stage are forwarded as errors
+    error = put
+
+
+# Scraper instance of the current parse worker, reused as long as the blacklist doesn't change
+_parse_scraper = None
+
+
+def replay_records(archive_path, entries, product_identifier, mode, prod_els, formatted_blacklist, follow_links, parser_backend, listing):
+    """ Parse the recorded pages of a chunk of the archive index, runs inside the parse executor and reads the archive itself
+
+    Returns (url, product_info, links, log_messages, listed_products) of every page, a broken record only gets a log message.
+    """
+    results = []
+    with open(archive_path, "rb") as file:
+        for url, offset, length in entries:
+            try:
+                response_text = read_record(file, offset, length)
+            except ValueError as e:
+                results.append((url, None, set(), [f"Error while replaying {url}: {e}"], []))
+                continue
+            product_info, links, log_messages, _, _, listed_products = parse_page(
+                url, response_text, product_identifier, mode, prod_els, formatted_blacklist, follow_links, parser_backend=parser_backend, listing=listing,
+            )
+            results.append((url, product_info, links, list(log_messages), listed_products))
+    return results
+
+
+def parse_page(url, response_text, product_identifier, mode, prod_els, formatted_blacklist, follow_links=True, delta=False, previous_fingerprint=None, timed=False, parser_backend=PARSER_BACKEND, listing=False):
+    """ Parse a page and return (product_info, links, log_messages, fingerprint, timings, listed_products), runs inside the parse executor
+
+    In delta mode the fingerprint of a product page is compared with the one of the last run first,
+    an unchanged page is not extracted (product_info is None).
+    If timed, timings holds the seconds of the parse, links and extraction stages, else it is empty.
+    The page is parsed by the given backend of parser_backend.py.
+    With listing, the product records of a category page with all LISTING_REQUIRED_FIELDS are returned as listed_products
+    (and dropped from the links), the URLs of the incomplete ones are added to the links, so their detail pages get fetched.
+    """
+    global _parse_scraper
+    if _parse_scraper is None or _parse_scraper.adv_settings.get("formatted_blacklist") != formatted_blacklist:
+        _parse_scraper = Scraper()
+        _parse_scraper.adv_settings = {"formatted_blacklist": formatted_blacklist}
+        _parse_scraper.compile_blacklist()
+
+    log_messages = LogCollector()
+    product_page = product_identifier in url
+    timings = {}
+    started = time.perf_counter()
+
+    # Only the pages whose links are followed and product pages in html mode need the tree,
+    # json mode takes the structured data fast path on the raw HTML
+    backend = get_parser_backend(parser_backend)
+    document = backend.parse(response_text) if follow_links or (product_page and mode != "json") else None
+    if timed:
+        timings["parse"] = time.perf_counter() - started
+        started = time.perf_counter()
+
+    # Find additional links to queue up for scraping (not needed in sitemap mode)
+    links = set()
+    domain = urlparse(url).netloc
+    if follow_links and document is not None:
+        links = _parse_scraper.get_all_links(url, domain, log_messages, backend.hrefs(document))
+
+        # A page with rel=canonical pointing to another product page is just a variant of it, only the canonical one gets extracted
+        canonical = backend.canonical_link(document)
+        if canonical:
+            canonical_links = _parse_scraper.get_all_links(url, domain, log_messages, [canonical])
+            links |= canonical_links
+            if product_page and canonical_links and url not in canonical_links and product_identifier in next(iter(canonical_links)):
+                product_page = False
+    if timed:
+        timings["links"] = time.perf_counter() - started
+        started = time.perf_counter()
+
+    # Listing extraction from the structured data of category pages
+    listed_products = []
+    if listing and follow_links and product_identifier not in url:
+        for listed_product in extract_listing_products(url, response_text, log_messages):
+            product_urls = _parse_scraper.get_all_links(url, domain, log_messages, [listed_product["url"]])
+            if not product_urls:
+                continue
+            listed_product["url"] = next(iter(product_urls))
+            if all(listed_product.get(field) for field in LISTING_REQUIRED_FIELDS):
+                listed_products.append(listed_product)
+                links.discard(listed_product["url"])
+            else:
+                links |= product_urls
+        if timed:
+            timings["extraction"] = time.perf_counter() - started
+
+    # If the URL contains the product identifier, extract product info
+    product_info = None
+    fingerprint = None
+    if product_page:
+        if delta:
+            fingerprint = page_fingerprint(response_text, mode, backend.main_html(document) if mode != "json" and document is not None else None)
+
+        # In delta mode a page unchanged since the last run is not extracted
+        if not (delta and fingerprint == previous_fingerprint):
+            if mode == "json":
+                product_info = extract_structured_product(url, response_text, log_messages)
+            elif document is not None:
+                product_info = backend.extract(url, document, prod_els, log_messages)
+        if timed:
+            timings["extraction"] = time.perf_counter() - started
+
+    return product_info, links, log_messages, fingerprint, timings, listed_products
@@ -0,0 +1,183 @@
+from array import array
+import hashlib
+import math
+import sqlite3
+import sys
+
+
+def url_hash(url):
+    """ 64-bit hash of a (normalized) URL, 0 is reserved as the empty slot marker """
+    return int.from_bytes(hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest(), "little") or 1
+
+
+class SetSeenStore:
+    """ Keeps the full URL strings in a set, exact but the biggest memory footprint """
+
+    def __init__(self):
+        self.urls = set()
+
+    def add(self, url):
+        self.urls.add(url)
+
+    def __contains__(self, url):
+        return url in self.urls
+
+    def __len__(self):
+        return len(self.urls)
+
+    def memory_usage(self):
+        return sys.getsizeof(self.urls) + sum(sys.getsizeof(url) for url in self.urls)
+
+    def close(self):
+        pass
+
+
+class HashSeenStore:
+    """ Keeps 64-bit hashes of the URLs in an open addressing hash table backed by a flat array (16 bytes per URL on average) """
+
+    def __init__(self, initial_capacity=1024):
+        self.slots = array("Q", bytes(8 * initial_capacity))
+        self.mask = initial_capacity - 1
+        self.count = 0
+
+    def _find(self, hashed):
+        """ Return the slot index of the hash, or of the empty slot where it belongs (linear probing) """
+        slots, mask = self.slots, self.mask
+        index = hashed & mask
+        while slots[index] and slots[index] != hashed:
+            index = (index + 1) & mask
+        return index
+
+    def add(self, url):
+        hashed = url_hash(url)
+        index = self._find(hashed)
+        if not self.slots[index]:
+            self.slots[index] = hashed
+            self.count += 1
+            # Keep the load factor at max. 0.5, so the probe sequences stay short
+            if self.count * 2 > len(self.slots):
+                self._grow()
+
+    def _grow(self):
+        old_slots = self.slots
+        self.slots = array("Q", bytes(16 * len(old_slots)))
+        self.mask = len(self.slots) - 1
+        for hashed in old_slots:
+            if hashed:
+                self.slots[self._find(hashed)] = hashed
+
+    def __contains__(self, url):
+        return bool(self.slots[self._find(url_hash(url))])
+
+    def __len__(self):
+        return self.count
+
+    def memory_usage(self):
+        return self.slots.itemsize * len(self.slots)
+
+    def close(self):
+        pass
+
+
+class BloomSeenStore:
+    """ Scalable Bloom filter, may report a few unseen URLs as seen (at the configured false positive rate), but never the other way round """
+
+    def __init__(self, false_positive_rate=0.0001, initial_capacity=1_000_000):
+        self.false_positive_rate = false_positive_rate
+        self.next_capacity = initial_capacity
+        self.filters = []
+        self.count = 0
+        self._add_filter()
+
+    def _add_filter(self):
+        """ Add a new filter twice as big as the last one, with a tightened error rate so the total rate stays bounded """
+        capacity = self.next_capacity
+        error_rate = self.false_positive_rate * (0.5 ** (len(self.filters) + 1))
+        bit_count = math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))
+        hash_count = max(1, round(bit_count / capacity * math.log(2)))
+        self.filters.append({"bits": bytearray((bit_count + 7) // 8), "bit_count": bit_count, "hash_count": hash_count, "capacity": capacity, "count": 0})
+        self.next_capacity *= 2
+
+    def _positions(self, bloom_filter, url):
+        # Double hashing: derive all bit positions from two 64-bit hashes
+        digest = hashlib.blake2b(url.encode("utf-8"), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return ((first + i * second) % bloom_filter["bit_count"] for i in range(bloom_filter["hash_count"]))
+
+    def add(self, url):
+        if url in self:
+            return
+        bloom_filter = self.filters[-1]
+        if bloom_filter["count"] >= bloom_filter["capacity"]:
+            self._add_filter()
+            bloom_filter = self.filters[-1]
+        bits = bloom_filter["bits"]
+        for position in self._positions(bloom_filter, url):
+            bits[position >> 3] |= 1 << (position & 7)
+        bloom_filter["count"] += 1
+        self.count += 1
+
+    def __contains__(self, url):
+        for bloom_filter in self.filters:
+            bits = bloom_filter["bits"]
+            if all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(bloom_filter, url)):
+                return True
+        return False
+
+    def __len__(self):
+        return self.count
+
+    def memory_usage(self):
+        return sum(len(bloom_filter["bits"]) for bloom_filter in self.filters)
+
+    def close(self):
+        pass
+
+
+class DiskSeenStore:
+    """ Keeps the hashes in memory up to a limit and spills them to a SQLite file beyond it """
+
+    def __init__(self, path, memory_limit=1_000_000):
+        self.memory = HashSeenStore()
+        self.memory_limit = memory_limit
+        self.spilled = 0
+        self.db = sqlite3.connect(path)
+        self.db.execute("DROP TABLE IF EXISTS seen")
+        self.db.execute("CREATE TABLE seen (hash INTEGER PRIMARY KEY)")
+
+    def add(self, url):
+        if url in self:
+            return
+        if len(self.memory) < self.memory_limit:
+            self.memory.add(url)
+        else:
+            # SQLite integers are signed 64-bit
+            self.db.execute("INSERT OR IGNORE INTO seen (hash) VALUES (?)", (url_hash(url) - (1 << 63),))
+            self.spilled += 1
+
+    def __contains__(self, url):
+        if url in self.memory:
+            return True
+        if not self.spilled:
+            return False
+        return self.db.execute("SELECT 1 FROM seen WHERE hash = ?", (url_hash(url) - (1 << 63),)).fetchone() is not None
+
+    def __len__(self):
+        return len(self.memory) + self.spilled
+
+    def memory_usage(self):
+        return self.memory.memory_usage()
+
+    def close(self):
+        self.db.close()
+
+
+def create_seen_store(kind, false_positive_rate, spill_path):
+    """ Create the seen-URL store configured by SEEN_STORE """
+    if kind == "hash":
+        return HashSeenStore()
+    if kind == "bloom":
+        return BloomSeenStore(false_positive_rate)
+    if kind == "disk":
+        return DiskSeenStore(spill_path)
+    return SetSeenStore()
@@ -0,0 +1,126 @@
+from urllib.parse import urlparse
+from lxml import etree
+import logging
+import zlib
+from transport import STREAM_TIMEOUT
+
+# size of the chunks the sitemaps are streamed in [bytes]
+SITEMAP_CHUNK_SIZE = 64 * 1024
+
+
+class SitemapError(Exception):
+    """ A sitemap could not be read completely, so the URLs of the sitemaps are incomplete """
+
+
+def local_name(tag):
+    """ Strip the XML namespace of a tag, e.g. {http://www.sitemaps.org/schemas/sitemap/0.9}loc -> loc """
+    return tag.rpartition("}")[2]
+
+
+async def find_sitemaps(session, start_url, headers, log_queue):
+    """ Return the sitemaps listed in the robots.txt of the domain, or the default /sitemap.xml """
+    parsed_url = urlparse(start_url)
+    base_url = f"{parsed_url.scheme}://{parsed_url.netloc}"
+    sitemaps = []
+
+    try:
+        async with session.get(f"{base_url}/robots.txt", headers=headers) as response:
+            if response.status == 200:
+                for line in (await response.text()).splitlines():
+                    key, _, value = line.partition(":")
+                    if key.strip().lower() == "sitemap" and value.strip():
+                        sitemaps.append(value.strip())
+    except Exception as e:
+        logging.error(f"Error while reading robots.txt of {base_url}: {e}")
+        log_queue.put(f"Error while reading robots.txt of {base_url}: {e}")
+
+    return sitemaps or [f"{base_url}/sitemap.xml"]
+
+
+async def iter_sitemap(session, sitemap_url, headers, log_queue):
+    """ Stream a (gzipped) sitemap or sitemap index and yield (kind, loc, lastmod), kind is "url" or "sitemap" """
+    parser = etree.XMLPullParser(events=("end",), recover=True, huge_tree=True)
+    decompressor = None
+    first_chunk = True
+
+    # The sitemap is streamed as fast as its pages get crawled, which may take much longer than a page request
+    async with session.get(sitemap_url, headers=headers, timeout=STREAM_TIMEOUT) as response:
+        if response.status != 200:
+            raise SitemapError(f"non-200 status code {response.status}")
+
+        async for chunk in response.content.iter_chunked(SITEMAP_CHUNK_SIZE):
+            # Gzipped sitemaps are decompressed chunk by chunk, never as a whole
+            if first_chunk:
+                first_chunk = False
+                if chunk[:2] == b"\x1f\x8b":
+                    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            if decompressor:
+                chunk = decompressor.decompress(chunk)
+
+            parser.feed(chunk)
+            for entry in read_entries(parser):
+                yield entry
+
+    if decompressor:
+        parser.feed(decompressor.flush())
+    parser.close()
+    for entry in read_entries(parser):
+        yield entry
+
+
+def read_entries(parser):
+    """ Collect the finished <url> and <sitemap> elements of the pull parser and free their memory """
+    for _, element in parser.read_events():
+        kind = local_name(element.tag) if isinstance(element.tag, str) else None
+        if kind not in ("url", "sitemap"):
+            continue
+
+        loc, lastmod = None, None
+        for child in element:
+            if not isinstance(child.tag, str):
+                continue
+            name = local_name(child.tag)
+            if name == "loc" and child.text:
+                loc = child.text.strip()
+            elif name == "lastmod" and child.text:
+                lastmod = child.text.strip()
+
+        # Drop the finished element and its already processed siblings, so the tree never grows
+        element.clear()
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+
+        if loc:
+            yield kind, loc, lastmod
+
+
+async def iter_sitemap_urls(session, start_url, headers, log_queue, modified_since=None):
+    """ Yield the page URLs of all sitemaps of the domain, optionally only the ones with a <lastmod> since the given ISO date
+
+    A sitemap which fails is logged and the others are read on, afterwards SitemapError tells that URLs may be missing.
+    """
+    to_read = await find_sitemaps(session, start_url, headers, log_queue)
+    read = set()
+    failed = []
+
+    while to_read:
+        sitemap_url = to_read.pop()
+        if sitemap_url in read:
+            continue
+        read.add(sitemap_url)
+        log_queue.put(f"Reading sitemap {sitemap_url}")
+
+        try:
+            async for kind, loc, lastmod in iter_sitemap(session, sitemap_url, headers, log_queue):
+                if kind == "sitemap":
+                    to_read.append(loc)
+                # ISO 8601 dates compare correctly as strings, pages without <lastmod> are always kept
+                elif not modified_since or not lastmod or lastmod[:10] >= modified_since:
+                    yield loc
+        except Exception as e:
+            logging.error(f"Error while reading sitemap {sitemap_url}: {e.__class__.__name__} - {e}")
+            log_queue.put(f"Error while reading sitemap {sitemap_url}: {e.__class__.__name__} - {e}")
+            failed.append(sitemap_url)
+
+    if failed:
+        raise SitemapError(f"{len(failed)} sitemap(s) could not be read completely, e.g. {failed[0]}")
@@ -0,0 +1,231 @@
+import json
+import re
+import lxml.etree
+
+# orjson decodes JSON-LD several times faster, the standard library is the fallback
+try:
+    import orjson
+    json_loads = orjson.loads
+    JSON_DECODE_ERRORS = (orjson.JSONDecodeError, json.JSONDecodeError)
+except ImportError:
+    json_loads = json.loads
+    JSON_DECODE_ERRORS = (json.JSONDecodeError,)
+
+# the JSON-LD blocks are cut straight out of the raw HTML, without parsing the page
+JSON_LD_PATTERN = re.compile(r'<script[^>]+type=["\']?application/ld\+json["\']?[^>]*>(.*?)</script>', re.IGNORECASE | re.DOTALL)
+
+OFFER_TYPES = ("Offer", "AggregateOffer")
+
+# OpenGraph / product meta properties and the product fields they stand for
+OPEN_GRAPH_FIELDS = {
+    "og:title": "name",
+    "og:image": "image",
+    "og:description": "desc",
+    "og:url": "url",
+    "product:retailer_item_id": "sku",
+    "product:price:amount": "price",
+    "og:price:amount": "price",
+}
+
+MICRODATA_FIELDS = {"name": "name", "image": "image", "description": "desc", "sku": "sku", "url": "url"}
+MICRODATA_PRICE_PROPS = ("price", "lowPrice")
+
+
+def iter_json_ld(response_text):
+    """ Yield the raw text of every JSON-LD block of a page """
+    for block in JSON_LD_PATTERN.findall(response_text):
+        block = block.strip()
+        if block:
+            yield block
+
+
+def has_type(data, type_names):
+    types = data.get("@type")
+    if isinstance(types, list):
+        return any(type_name in types for type_name in type_names)
+    return types in type_names
+
+
+def iter_json_ld_products(data):
+    """ Yield every Product node of decoded JSON-LD, also inside lists and @graph wrappers """
+    if isinstance(data, list):
+        for item in data:
+            yield from iter_json_ld_products(item)
+    elif isinstance(data, dict):
+        if has_type(data, ("Product",)):
+            yield data
+        elif "@graph" in data:
+            yield from iter_json_ld_products(data["@graph"])
+
+
+def normalize_price(price):
+    """ Prices are exported with a decimal comma, numeric JSON-LD prices included """
+    if price is None or price == "":
+        return ""
+    return str(price).replace(".", ",")
+
+
+def text_value(value):
+    """ A text field of JSON-LD as a string, e.g. a numeric sku or name """
+    return "" if value is None else str(value)
+
+
+def first_offer(offers):
+    """ The first Offer or AggregateOffer of the offers of a product, which may be a single one or a list """
+    if isinstance(offers, list):
+        offers = next((offer for offer in offers if isinstance(offer, dict)), {})
+    return offers if isinstance(offers, dict) else {}
+
+
+def offer_price(offer):
+    if offer.get("price") not in (None, ""):
+        return offer["price"]
+    # AggregateOffers come with a price range, or with their single offers nested
+    if has_type(offer, ("AggregateOffer",)):
+        if offer.get("lowPrice") not in (None, ""):
+            return offer["lowPrice"]
+        nested = first_offer(offer.get("offers"))
+        if nested:
+            return offer_price(nested)
+    price_specification = offer.get("priceSpecification")
+    if isinstance(price_specification, list):
+        price_specification = price_specification[0] if price_specification else {}
+    if isinstance(price_specification, dict):
+        return price_specification.get("price")
+    return None
+
+
+def first_image(image):
+    if isinstance(image, list):
+        image = image[0] if image else ""
+    if isinstance(image, dict):
+        image = image.get("url") or image.get("contentUrl") or ""
+    return image
+
+
+def product_from_json_ld(url, data):
+    """ Map a JSON-LD Product node onto the exported product fields """
+    offer = first_offer(data.get("offers"))
+    return {
+        'name': text_value(data.get("name")),
+        'image': first_image(data.get("image", "")),
+        'desc': text_value(data.get("description")),
+        'sku': text_value(data.get("sku")),
+        'price': normalize_price(offer_price(offer)),
+        'url': offer.get("url") or url,
+    }
+
+
+def product_from_json_ld_blocks(url, blocks, log_queue):
+    """ Return the first Product of the given raw JSON-LD blocks, or None """
+    for block in blocks:
+        if not block:
+            continue
+        try:
+            data = json_loads(block)
+        except JSON_DECODE_ERRORS as e:
+            log_queue.put(f"Error parsing JSON from {url}: {e}")
+            continue
+        for product in iter_json_ld_products(data):
+            return product_from_json_ld(url, product)
+    return None
+
+
+class MicrodataTarget:
+    """ lxml parser target collecting the microdata Product and the OpenGraph meta tags in one streaming pass, no tree is built """
+
+    def __init__(self):
+        self.depth = 0
+        # (itemtype, depth) of the open itemscopes
+        self.scopes = []
+        self.product_depth = None
+        self.product_done = False
+        # (field, depth, collected text) of an itemprop element whose text is being collected
+        self.collecting = None
+        self.microdata = {}
+        self.open_graph = {}
+
+    def start(self, tag, attrib):
+        self.depth += 1
+
+        if tag == "meta" and attrib.get("property") in OPEN_GRAPH_FIELDS:
+            self.open_graph.setdefault(OPEN_GRAPH_FIELDS[attrib["property"]], attrib.get("content", ""))
+
+        itemprop = attrib.get("itemprop")
+        if itemprop and self.product_depth is not None:
+            self.add_property(tag, attrib, itemprop)
+
+        if "itemscope" in attrib:
+            itemtype = attrib.get("itemtype", "").rsplit("/", 1)[-1]
+            self.scopes.append((itemtype, self.depth))
+            if itemtype == "Product" and self.product_depth is None and not self.product_done:
+                self.product_depth = self.depth
+
+    def add_property(self, tag, attrib, itemprop):
+        # Only the direct properties of the product, and the price of its offers
+        scope_type = self.scopes[-1][0] if self.scopes else None
+        if scope_type == "Product" and self.scopes[-1][1] == self.product_depth:
+            field = MICRODATA_FIELDS.get(itemprop)
+        elif scope_type in OFFER_TYPES and itemprop in MICRODATA_PRICE_PROPS:
+            field = "price"
+        else:
+            field = None
+        if not field or field in self.microdata:
+            return
+
+        for value_attribute in ("content", "src", "href"):
+            if value_attribute in attrib:
+                self.microdata[field] = attrib[value_attribute]
+                return
+        self.collecting = (field, self.depth, [])
+
+    def data(self, data):
+        if self.collecting:
+            self.collecting[2].append(data)
+
+    def end(self, tag):
+        if self.collecting and self.collecting[1] == self.depth:
+            field, _, texts = self.collecting
+            self.microdata[field] = " ".join("".join(texts).split())
+            self.collecting = None
+        if self.scopes and self.scopes[-1][1] == self.depth:
+            self.scopes.pop()
+            if self.depth == self.product_depth:
+                # Only the first product of the page
+                self.product_depth = None
+                self.product_done = True
+        self.depth -= 1
+
+    def close(self):
+        return self.microdata, self.open_graph
+
+
+def product_from_microdata(url, response_text):
+    """ Return the product of the microdata, completed by the OpenGraph tags, or None """
+    parser = lxml.etree.HTMLParser(target=MicrodataTarget())
+    try:
+        # lxml refuses str input with an encoding declaration, so hand it bytes
+        parser.feed(response_text.encode("utf-8"))
+        microdata, open_graph = parser.close()
+    except lxml.etree.LxmlError:
+        return None
+
+    fields = {**open_graph, **microdata}
+    if not fields.get("name") and not fields.get("sku"):
+        return None
+    return {
+        'name': fields.get("name", ""),
+        'image': fields.get("image", ""),
+        'desc': fields.get("desc", ""),
+        'sku': fields.get("sku", ""),
+        'price': normalize_price(fields.get("price")),
+        'url': fields.get("url") or url,
+    }
+
+
+def extract_structured_product(url, response_text, log_queue):
+    """ Fast path of json mode: the JSON-LD Product of the raw HTML, or else its microdata/OpenGraph product """
+    product_info = product_from_json_ld_blocks(url, iter_json_ld(response_text), log_queue)
+    if product_info is None:
+        product_info = product_from_microdata(url, response_text)
+    return product_info
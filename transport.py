@@ -0,0 +1,197 @@
+import asyncio
+import codecs
+import re
+import aiohttp
+from constants import CONNECTION_LIMIT, CONNECTION_LIMIT_PER_HOST, DNS_CACHE_TTL, KEEPALIVE_TIMEOUT, CONNECT_TIMEOUT, RESPONSE_TIMEOUT, HTTP2, HTML_CONTENT_TYPES
+
+# Brotli is only decoded by aiohttp (and httpx) if one of the brotli packages is installed
+try:
+    import brotli  # noqa: F401
+    ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401
+        ACCEPT_ENCODING = "gzip, deflate, br"
+    except ImportError:
+        ACCEPT_ENCODING = "gzip, deflate"
+
+# charset of the Content-Type header and of a <meta charset> or <meta http-equiv="Content-Type"> in the first KB of a page (the prescan of browsers)
+CHARSET_PATTERN = re.compile(r'charset\s*=\s*["\']?\s*([\w.:-]+)', re.IGNORECASE)
+META_CHARSET_PATTERN = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?\s*([\w.:-]+)', re.IGNORECASE)
+CHARSET_PRESCAN_SIZE = 1024
+
+# timeout of responses which are streamed along with the crawl, like the sitemaps: no total time, only a limit per read
+STREAM_TIMEOUT = aiohttp.ClientTimeout(total=None, sock_connect=CONNECT_TIMEOUT, sock_read=RESPONSE_TIMEOUT)
+
+
+def is_html_content_type(content_type):
+    """ Whether a Content-Type is the one of a page, a missing Content-Type is given the benefit of the doubt """
+    mimetype = content_type.split(";", 1)[0].strip().lower()
+    return not mimetype or mimetype in HTML_CONTENT_TYPES
+
+
+def page_encoding(content_type, body):
+    """ The encoding of a page: its BOM, the charset of the Content-Type, a <meta> charset in its first KB, else UTF-8 """
+    if body.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    match = CHARSET_PATTERN.search(content_type)
+    candidates = [match.group(1)] if match else []
+    match = META_CHARSET_PATTERN.search(body[:CHARSET_PRESCAN_SIZE])
+    if match:
+        candidates.append(match.group(1).decode("ascii", errors="ignore"))
+    for candidate in candidates:
+        try:
+            return codecs.lookup(candidate).name
+        except LookupError:
+            continue
+    return "utf-8"
+
+
+class TransportStats:
+    """ Counts new and reused connections and DNS cache hits, to see whether the keep-alive works """
+
+    def __init__(self):
+        self.new_connections = 0
+        self.reused_connections = 0
+        self.dns_cache_hits = 0
+        self.dns_cache_misses = 0
+
+    def trace_config(self):
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_connection_create_end(session, context, params):
+            self.new_connections += 1
+
+        async def on_connection_reuseconn(session, context, params):
+            self.reused_connections += 1
+
+        async def on_dns_cache_hit(session, context, params):
+            self.dns_cache_hits += 1
+
+        async def on_dns_cache_miss(session, context, params):
+            self.dns_cache_misses += 1
+
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace_config.on_dns_cache_hit.append(on_dns_cache_hit)
+        trace_config.on_dns_cache_miss.append(on_dns_cache_miss)
+        return trace_config
+
+    def summary(self):
+        requests = self.new_connections + self.reused_connections
+        reuse = round(100 * self.reused_connections / requests, 1) if requests else 0
+        return (f"Connections: {self.new_connections} opened, {self.reused_connections} reused ({reuse}% reuse) | "
+                f"DNS cache: {self.dns_cache_hits} hits, {self.dns_cache_misses} misses.")
+
+
+def create_session(stats, metrics=None, concurrency=None):
+    """ Create the HTTP session with tuned connection pool, DNS cache, keep-alive, timeouts and compression, optionally with the metrics trace hooks
+
+    With a concurrency the connection pool is sized for it, so the connections never limit the workers of the scheduler.
+    """
+    connection_limit = concurrency or CONNECTION_LIMIT
+    connection_limit_per_host = concurrency or CONNECTION_LIMIT_PER_HOST
+    headers = {"Accept-Encoding": ACCEPT_ENCODING}
+    timeout = aiohttp.ClientTimeout(total=RESPONSE_TIMEOUT, sock_connect=CONNECT_TIMEOUT)
+
+    if HTTP2:
+        return Http2Session(headers, stats, connection_limit)
+
+    connector = aiohttp.TCPConnector(
+        limit=connection_limit,
+        limit_per_host=connection_limit_per_host,
+        ttl_dns_cache=DNS_CACHE_TTL,
+        keepalive_timeout=KEEPALIVE_TIMEOUT,
+    )
+    trace_configs = [stats.trace_config()] + ([metrics.trace_config()] if metrics else [])
+    return aiohttp.ClientSession(connector=connector, headers=headers, timeout=timeout, trace_configs=trace_configs)
+
+
+class Http2Session:
+    """ Optional HTTP/2 backend on httpx, exposing the small part of the aiohttp session API the scraper uses """
+
+    def __init__(self, headers, stats, connection_limit=CONNECTION_LIMIT):
+        import httpx
+        self.httpx = httpx
+        self.stats = stats
+        self.hosts = set()
+        self.client = httpx.AsyncClient(
+            http2=True,
+            headers=headers,
+            timeout=httpx.Timeout(RESPONSE_TIMEOUT, connect=CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=connection_limit, keepalive_expiry=KEEPALIVE_TIMEOUT),
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.client.aclose()
+
+    def get(self, url, headers=None, timeout=None):
+        # httpx times every read on its own, so a long streamed response never needs a timeout of its own
+        return Http2Response(self, url, headers)
+
+
+class Http2Response:
+    """ Async context manager wrapping a streamed httpx response like an aiohttp ClientResponse """
+
+    def __init__(self, session, url, headers):
+        self.session = session
+        self.url = url
+        self.request_headers = headers
+        self.stream = None
+        self.response = None
+        self.content = self
+
+    async def __aenter__(self):
+        httpx = self.session.httpx
+        self.stream = self.session.client.stream("GET", self.url, headers=self.request_headers)
+        try:
+            self.response = await self.stream.__aenter__()
+        except httpx.TimeoutException as e:
+            raise asyncio.TimeoutError() from e
+        except httpx.TransportError as e:
+            raise aiohttp.ClientConnectionError(str(e)) from e
+
+        # With HTTP/2 all requests to a host share one connection, so every request after the first one is a reuse
+        # (httpx doesn't tell about the reuse of HTTP/1.1 connections, those are not counted)
+        if self.response.http_version == "HTTP/2":
+            host = self.response.url.host
+            if host in self.session.hosts:
+                self.session.stats.reused_connections += 1
+            else:
+                self.session.hosts.add(host)
+                self.session.stats.new_connections += 1
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.stream.__aexit__(*exc_info)
+
+    @property
+    def status(self):
+        return self.response.status_code
+
+    @property
+    def reason(self):
+        return self.response.reason_phrase
+
+    @property
+    def headers(self):
+        return self.response.headers
+
+    async def text(self):
+        try:
+            await self.response.aread()
+        except self.session.httpx.TimeoutException as e:
+            raise asyncio.TimeoutError() from e
+        return self.response.text
+
+    async def iter_chunked(self, size):
+        try:
+            async for chunk in self.response.aiter_bytes(size):
+                yield chunk
+        except self.session.httpx.TimeoutException as e:
+            raise asyncio.TimeoutError() from e
+        except self.session.httpx.TransportError as e:
+            raise aiohttp.ClientConnectionError(str(e)) from e
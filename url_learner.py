@@ -0,0 +1,172 @@
+from collections import Counter, defaultdict
+from urllib.parse import urlsplit, parse_qsl
+import json
+import os
+import re
+
+# tokens of a path segment which differ from page to page: numbers, IDs and hashes
+NUMBER_SEGMENT_PATTERN = re.compile(r"^\d+$")
+ID_SEGMENT_PATTERN = re.compile(r"^(?=.*\d)(?=.*[a-zA-Z])[\w-]{12,}$|^[0-9a-f]{8,}$", re.IGNORECASE)
+NUMBERS_PATTERN = re.compile(r"\d+")
+
+# pages of a template or depth with fewer visits are not rated yet, the next less specific template is used instead
+MIN_SAMPLES = 10
+
+# weight of the shop wide yield in the smoothed yield of a template, so a few lucky pages don't dominate
+PRIOR_WEIGHT = 5
+
+# depths beyond this share their statistics
+MAX_DEPTH_BUCKET = 8
+
+# a saved model of the last run counts half, so the learner adapts when the shop changes
+SAVED_MODEL_WEIGHT = 0.5
+
+
+def segment_template(segment):
+    if NUMBER_SEGMENT_PATTERN.match(segment):
+        return "{n}"
+    if ID_SEGMENT_PATTERN.match(segment):
+        return "{id}"
+    return NUMBERS_PATTERN.sub("{n}", segment.lower())
+
+
+def url_templates(url):
+    """ The path templates of a URL from the least to the most specific, e.g. /blog, /blog/{n}, /blog/{n}/my-post?page """
+    parsed = urlsplit(url)
+    segments = [segment_template(segment) for segment in parsed.path.split("/") if segment]
+    templates = ["/" + "/".join(segments[:level]) for level in range(1, len(segments) + 1)] or ["/"]
+    if parsed.query:
+        # filter and sort variants of a page get a template of their own
+        params = sorted({key.lower() for key, _ in parse_qsl(parsed.query, keep_blank_values=True)})
+        templates.append(f"{templates[-1]}?{'&'.join(params)}")
+    return templates
+
+
+class UrlPatternLearner:
+    """ Learns online which path templates and depths lead to new product URLs, to deprioritize or drop the branches that don't
+
+    Every visited page is counted for all its templates and its depth, together with the new product links found on it
+    (the product_identifier hits). A URL is rated by its most specific template with enough visits, else by its depth.
+    With action "deprioritize" the frontier hands out the URLs of low-yield templates last, with "drop" they are not
+    enqueued at all, with "off" the learned yield only adds to the priority.
+    """
+
+    def __init__(self, product_identifier, action, min_pages, yield_threshold, explore_every):
+        self.product_identifier = product_identifier
+        self.action = action
+        self.min_pages = min_pages
+        self.yield_threshold = yield_threshold
+        self.explore_every = explore_every
+        # key (a template or "depth:<n>") -> [visited pages, new product links]
+        self.stats = defaultdict(lambda: [0.0, 0.0])
+        self.total = [0.0, 0.0]
+        self.pruned = Counter()
+        self.pruned_since_explore = Counter()
+
+    def keys(self, url, depth):
+        return url_templates(url) + [f"depth:{min(depth, MAX_DEPTH_BUCKET)}"]
+
+    def record(self, url, depth, new_links):
+        """ Learn from a visited page and the links on it, which have not been enqueued before """
+        product_links = sum(1 for link in new_links if self.product_identifier in link) if self.product_identifier else 0
+        for key in self.keys(url, depth):
+            stats = self.stats[key]
+            stats[0] += 1
+            stats[1] += product_links
+        self.total[0] += 1
+        self.total[1] += product_links
+
+    def rating(self, url, depth):
+        """ (template or depth the URL is rated by, smoothed new product links per page), None if nothing is known yet """
+        templates = url_templates(url)
+        depth_key = f"depth:{min(depth, MAX_DEPTH_BUCKET)}"
+        for key in reversed(templates):
+            if key in self.stats and self.stats[key][0] >= MIN_SAMPLES:
+                return key, self.smoothed(self.stats[key])
+        if depth_key in self.stats and self.stats[depth_key][0] >= MIN_SAMPLES:
+            return depth_key, self.smoothed(self.stats[depth_key])
+        return None
+
+    def smoothed(self, stats):
+        prior = self.total[1] / self.total[0] if self.total[0] else 0
+        return (stats[1] + PRIOR_WEIGHT * prior) / (stats[0] + PRIOR_WEIGHT)
+
+    def yield_rate(self, url, depth):
+        rating = self.rating(url, depth)
+        return rating[1] if rating else 0
+
+    def low_yield(self, url, depth):
+        """ The template of the URL if it has been visited min_pages times and brings up too few product links, else None
+
+        The yield is compared to the shop wide one, which drops as well when most products have been found,
+        so the branches which still bring up products are never pruned towards the end of a crawl.
+        """
+        if self.product_identifier and self.product_identifier in url:
+            return None
+        rating = self.rating(url, depth)
+        if rating is None or not self.total[1]:
+            return None
+        key, rate = rating
+        shop_rate = self.total[1] / self.total[0]
+        if key.startswith("depth:") or self.stats[key][0] < self.min_pages or rate >= self.yield_threshold * shop_rate:
+            return None
+        return key
+
+    def deprioritize(self, url, depth):
+        """ Whether the frontier should hand out a URL last """
+        if self.action != "deprioritize":
+            return False
+        key = self.low_yield(url, depth)
+        if key is None:
+            return False
+        self.pruned[key] += 1
+        return True
+
+    def prune(self, url, depth):
+        """ The template if a URL should be dropped, every explore_every-th URL of a pruned template still gets through """
+        if self.action != "drop":
+            return None
+        key = self.low_yield(url, depth)
+        if key is None:
+            return None
+        self.pruned_since_explore[key] += 1
+        if self.explore_every and self.pruned_since_explore[key] >= self.explore_every:
+            # Keep exploring a little, the shop may have changed since the template was learned
+            self.pruned_since_explore[key] = 0
+            return None
+        self.pruned[key] += 1
+        return key
+
+    def load(self, path, weight=SAVED_MODEL_WEIGHT):
+        """ Continue with the model saved by the last run of the shop, its counts weighted """
+        if not os.path.exists(path):
+            return False
+        try:
+            with open(path, encoding="utf-8") as file:
+                saved = json.load(file)
+        except (OSError, ValueError):
+            return False
+        if saved.get("product_identifier") != self.product_identifier:
+            # Learned with another product identifier, the yields don't apply
+            return False
+        for key, (visited, product_links) in saved.get("stats", {}).items():
+            self.stats[key] = [visited * weight, product_links * weight]
+        visited, product_links = saved.get("total", [0, 0])
+        self.total = [visited * weight, product_links * weight]
+        return True
+
+    def save(self, path):
+        """ Save the model for the next run, replaced atomically; templates seen only once are left out """
+        stats = {key: [round(visited, 2), round(product_links, 2)] for key, (visited, product_links) in self.stats.items() if visited >= 2}
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            json.dump({"product_identifier": self.product_identifier, "total": self.total, "stats": stats}, file)
+        os.replace(temporary_path, path)
+
+    def summary(self):
+        pruned = sum(self.pruned.values())
+        if not pruned:
+            return "URL patterns: no low-yield branch found."
+        top = ", ".join(f"{key} ({count})" for key, count in self.pruned.most_common(3))
+        action = "dropped" if self.action == "drop" else "deprioritized"
+        return f"URL patterns: {pruned} low-yield URLs {action}, mostly {top}."